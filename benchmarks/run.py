@@ -0,0 +1,251 @@
+"""
+Benchmarks of the notebook conversion, the TOC and the cache
+
+Times the micro paths (nb2html, nb2md, the TOC and the cache hit path) on
+synthetic notebooks and end-to-end `mkdocs build` of sites with many
+notebooks, cold and with a warm cache. The peak memory of every benchmark is
+measured in a separate run with tracemalloc.
+
+    python benchmarks/run.py                  # run and compare to the baseline
+    python benchmarks/run.py --save-baseline  # store the results as baseline
+    python benchmarks/run.py -k toc --sites 1,100,1000
+
+A benchmark fails when it is slower than the baseline by more than the
+threshold (default 20%), the baseline is machine specific.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from mkdocs.commands.build import build
+from mkdocs.config import load_config
+
+from mkdocs_jupyter import cache, convert, nbconvert2, plugin
+
+import synthetic
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# (cells, output_size, images) of the notebooks of the micro benchmarks
+SHAPES = {
+    "small": (10, 200, 0),
+    "large": (200, 2000, 0),
+    "outputs": (20, 100_000, 0),
+    "images": (20, 200, 20),
+}
+
+
+def micro_benchmarks(tmp_dir):
+    """Yield (name, function) for the conversion, TOC and cache paths"""
+    for shape, (cells, output_size, images) in SHAPES.items():
+        nb = synthetic.make_notebook(cells, output_size, images)
+        for extension in synthetic.FORMATS:
+            if extension != ".ipynb" and shape != "small":
+                continue
+            path = os.path.join(tmp_dir, f"{shape}{extension}")
+            synthetic.write_notebook(nb, path)
+            suffix = f"{shape}{extension}"
+            yield f"nb2html[{suffix}]", lambda path=path: nb2html(path)
+            yield f"nb2md[{suffix}]", lambda path=path: convert.nb2md(path)
+            yield (
+                f"toc[{suffix}]",
+                lambda path=path: plugin._get_nb_toc_tokens(path, 6),
+            )
+
+    # Cache hit: computing the key and reading the entry
+    path = os.path.join(tmp_dir, "large.ipynb")
+    config = {
+        key: option.default
+        for key, option in plugin.Plugin.config_scheme
+        if hasattr(option, "default")
+    }
+    entry = {
+        "content": convert.nb2html(path),
+        "toc_tokens": [],
+        "title": None,
+        "outputs": [],
+    }
+    for backend in ("json", "sqlite"):
+        cache_dir = os.path.join(tmp_dir, f"cache-{backend}")
+        store = cache.get_store(backend, cache_dir)
+        manifest = {}
+        key = plugin._compute_cache_key(path, config, False, manifest=manifest)
+        store.put(key, entry)
+
+        def hit(store=store, manifest=manifest):
+            key = plugin._compute_cache_key(path, config, False, manifest=manifest)
+            assert store.get(key) is not None
+
+        yield f"cache-hit[{backend}]", hit
+
+
+def nb2html(path):
+    # The highlighted cells are cached in memory, measure a first conversion
+    nbconvert2._highlight.cache_clear()
+    return convert.nb2html(path)
+
+
+def site_benchmarks(tmp_dir, sizes):
+    """Yield (name, function) building sites with a cold and a warm cache
+
+    The sites are built in a new process like `mkdocs build`, mkdocs keeps
+    the plugin (and its in-memory caches) across builds in the same process.
+    """
+    for size in sizes:
+        directory = os.path.join(tmp_dir, f"site-{size}")
+        cache_dir = os.path.join(directory, "cache")
+        config_file = synthetic.make_site(
+            directory,
+            notebooks=size,
+            cells=10,
+            output_size=500,
+            images=2,
+            plugin_config={"cache_dir": cache_dir},
+        )
+
+        def cold(memory=False, cache_dir=cache_dir, config_file=config_file):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            return build_site(config_file, memory)
+
+        def warm(memory=False, cache_dir=cache_dir, config_file=config_file):
+            if not os.path.isdir(cache_dir):
+                build_site(config_file)
+            return build_site(config_file, memory)
+
+        yield f"build-cold[{size}]", cold
+        yield f"build-warm[{size}]", warm
+
+
+def build_site(config_file, memory=False):
+    """Build a site in a new process, return its build time and peak memory"""
+    cmd = [sys.executable, __file__, "--build", config_file]
+    if memory:
+        cmd.append("--memory")
+    stdout = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(stdout.splitlines()[-1])
+
+
+def measure(func, repeat):
+    """Return the timings of `repeat` runs and the peak memory of one more"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "peak_memory": peak,
+    }
+
+
+def measure_build(func, repeat):
+    """Same as `measure` for the site benchmarks that run in a new process"""
+    times = [func()["time"] for _ in range(repeat)]
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "peak_memory": func(memory=True)["peak_memory"],
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the results next to the baseline, return the regressions"""
+    regressions = []
+    print(
+        f"{'benchmark':32} {'median':>10} {'baseline':>10} {'change':>8} {'peak':>10}"
+    )
+    for name, result in results.items():
+        line = f"{name:32} {result['median']:>9.4f}s"
+        base = baseline.get(name)
+        if base:
+            change = result["median"] / base["median"] - 1
+            line += f" {base['median']:>9.4f}s {change:>+7.1%}"
+            if change > threshold:
+                regressions.append(name)
+                line += " !"
+        else:
+            line += f" {'-':>10} {'-':>8}"
+        line += f" {result['peak_memory'] / 2**20:>8.1f}MB"
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-k", default="", help="Only run the benchmarks matching")
+    parser.add_argument(
+        "--sites",
+        default="1,100",
+        help="Number of notebooks of the sites to build (default: 1,100)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", help="Write the results to this file")
+    # Used by build_site
+    parser.add_argument("--build", help=argparse.SUPPRESS)
+    parser.add_argument("--memory", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    logging.getLogger("mkdocs").setLevel(logging.WARNING)
+    if args.build:
+        if args.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        build(load_config(args.build))
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+        print(json.dumps({"time": elapsed, "peak_memory": peak}))
+        return 0
+
+    sizes = [int(size) for size in args.sites.split(",") if size]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, func in micro_benchmarks(tmp_dir):
+            if args.k in name:
+                func()  # warm up the exporters
+                results[name] = measure(func, args.repeat)
+        for name, func in site_benchmarks(tmp_dir, sizes):
+            if args.k in name:
+                results[name] = measure_build(func, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**baseline, **results}, f, indent=2)
+        return 0
+    if regressions:
+        print(f"Slower than the baseline by more than {args.threshold:.0%}:")
+        for name in regressions:
+            print(f"  {name}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
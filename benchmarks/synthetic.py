@@ -0,0 +1,124 @@
+"""
+Synthetic notebooks for the benchmarks
+
+The notebooks alternate markdown cells with headings and code cells with
+stream outputs and PNG images, so their size and shape can be tuned with the
+number of cells, the size of the outputs and the number of images.
+"""
+
+import os
+import struct
+import zlib
+from base64 import b64encode
+
+import jupytext
+import nbformat
+from nbformat.v4 import (
+    new_code_cell,
+    new_markdown_cell,
+    new_notebook,
+    new_output,
+)
+
+KERNELSPEC = {"name": "python3", "display_name": "Python 3", "language": "python"}
+
+# Extension and jupytext format of the notebook variants
+FORMATS = {".ipynb": None, ".py": "py:percent", ".md": "md"}
+
+
+def make_notebook(cells=20, output_size=200, images=0, image_width=200, seed=0):
+    """Return a notebook with `cells` code cells
+
+    Every code cell prints `output_size` bytes, the first `images` code cells
+    also display a PNG image `image_width` pixels wide.
+    """
+    nb = new_notebook(
+        metadata={
+            "kernelspec": KERNELSPEC,
+            "language_info": {"name": "python"},
+        }
+    )
+    line = "epoch {i:05d} loss={loss:.6f}\n"
+    for index in range(cells):
+        nb.cells.append(
+            new_markdown_cell(
+                f"## Section {index}\n\nSome text with `code` and **bold** words "
+                f"describing step {index} of the analysis.\n"
+            )
+        )
+        text = ""
+        while len(text) < output_size:
+            text += line.format(i=len(text), loss=1 / (len(text) + 1))
+        outputs = [new_output("stream", name="stdout", text=text[:output_size])]
+        if index < images:
+            png = make_png(image_width, image_width // 2, seed=seed + index)
+            outputs.append(
+                new_output("display_data", data={"image/png": b64encode(png).decode()})
+            )
+        nb.cells.append(
+            new_code_cell(
+                f"import numpy as np\n\nresult_{index} = np.arange({index}) + {seed}\n"
+                f"for i in range(10):\n    print(f'epoch {{i}}', result_{index}.sum())",
+                execution_count=index + 1,
+                outputs=outputs,
+            )
+        )
+    return nb
+
+
+def make_png(width, height, seed=0):
+    """Return a PNG image of pseudo-random gray pixels (they do not compress)"""
+    state = seed * 7919 + 1
+    rows = []
+    for _ in range(height):
+        row = bytearray([0])
+        for _ in range(width):
+            state = (state * 1103515245 + 12345) & 0x7FFFFFFF
+            row.append(state >> 23)
+        rows.append(bytes(row))
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"".join(rows)))
+        + chunk(b"IEND", b"")
+    )
+
+
+def write_notebook(nb, path):
+    """Write a notebook as .ipynb or as a jupytext .py or .md file"""
+    fmt = FORMATS[os.path.splitext(path)[1]]
+    if fmt is None:
+        nbformat.write(nb, path)
+    else:
+        # Jupytext files do not keep the outputs
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(jupytext.writes(nb, fmt=fmt))
+    return path
+
+
+def make_site(directory, notebooks=1, extension=".ipynb", plugin_config=None, **nb):
+    """Write an mkdocs project with `notebooks` synthetic notebooks
+
+    `nb` are the arguments of `make_notebook`. Returns the mkdocs.yml path.
+    """
+    docs_dir = os.path.join(directory, "docs")
+    os.makedirs(docs_dir, exist_ok=True)
+    with open(os.path.join(docs_dir, "index.md"), "w", encoding="utf-8") as f:
+        f.write("# Benchmark\n")
+    for index in range(notebooks):
+        path = os.path.join(docs_dir, f"notebook-{index:04d}{extension}")
+        write_notebook(make_notebook(seed=index, **nb), path)
+
+    config_file = os.path.join(directory, "mkdocs.yml")
+    plugin_config = {"include": [f"*{extension}"], **(plugin_config or {})}
+    with open(config_file, "w", encoding="utf-8") as f:
+        f.write("site_name: benchmark\nplugins:\n  - mkdocs-jupyter:\n")
+        for key, value in plugin_config.items():
+            f.write(f"      {key}: {value!r}\n")
+    return config_file
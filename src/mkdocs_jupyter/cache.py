@@ -0,0 +1,770 @@
+"""
+Stores for the rendered notebooks cache
+
+An entry is a dict with the rendered HTML ``content``, the ``toc_tokens`` and
+the ``title`` of a notebook, stored under the key from ``_compute_cache_key``.
+
+- ``JSONStore`` writes one JSON file per entry in the cache directory
+- ``SQLiteStore`` keeps an index in ``index.sqlite`` with the HTML stored as a
+  zlib compressed blob, so hits are a primary key lookup and the HTML is
+  never escaped into a JSON string
+
+Executed notebooks are cached as ``.ipynb`` files in the ``executed``
+directory, keyed only by the source and the execution options, so changing a
+presentation option renders the notebooks again without executing them.
+
+With ``extract_outputs`` the images of the notebooks are files in the
+``outputs`` directory named after their content, the entries have the names of
+the files they link to in ``outputs``.
+
+``MemoryCache`` keeps the most recently used entries in memory, the plugin
+instance lives across the ``mkdocs serve`` rebuilds so unchanged notebooks are
+not read from disk again.
+
+``LayeredStore`` looks up entries in a local store first and then in the
+read-only stores of shared cache directories, hits in a shared directory are
+written back to the local store.
+
+Every build is recorded in ``builds.json`` with its cache hits and misses.
+The module is also a command line tool to inspect, clean and share a cache
+directory:
+
+    python -m mkdocs_jupyter.cache stats
+    python -m mkdocs_jupyter.cache gc --keep-builds 5 --max-age 30d
+    python -m mkdocs_jupyter.cache export cache.tar.gz
+    python -m mkdocs_jupyter.cache import cache.tar.gz
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import logging
+import os
+import pathlib
+import re
+import shutil
+import sqlite3
+import sys
+import tarfile
+import tempfile
+import time
+import zlib
+
+import nbformat
+
+logger = logging.getLogger("mkdocs.plugins.mkdocs_jupyter")
+
+# Maps notebook paths and their stat to the digest of their content
+MANIFEST_FILENAME = "manifest.json"
+SQLITE_FILENAME = "index.sqlite"
+BUILDS_FILENAME = "builds.json"
+# JSON files in the cache directory that are not entries
+RESERVED_FILENAMES = {MANIFEST_FILENAME, BUILDS_FILENAME}
+# Directory of the cell cache (see preprocessors.CellCache)
+CELLS_DIRNAME = "cells"
+EXECUTED_DIRNAME = "executed"
+# Directory of the extracted outputs (see preprocessors.ExtractOutputs)
+OUTPUTS_DIRNAME = "outputs"
+MAX_BUILDS = 100
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+AGE_UNITS = {"": 1, "S": 1, "M": 60, "H": 3600, "D": 86400, "W": 7 * 86400}
+
+
+def get_store(backend, cache_dir, shared_dirs=()):
+    """Return the store for a ``cache_backend`` config value
+
+    With shared_dirs the store is a LayeredStore that also reads the entries
+    of the stores in those directories.
+    """
+    store = SQLiteStore(cache_dir) if backend == "sqlite" else JSONStore(cache_dir)
+    if not shared_dirs:
+        return store
+    shared = []
+    for shared_dir in shared_dirs:
+        if not os.path.isdir(shared_dir):
+            logger.warning("Shared cache directory does not exist: %s", shared_dir)
+            continue
+        shared.extend(get_stores(shared_dir, readonly=True))
+    return LayeredStore(store, shared)
+
+
+def parse_size(value):
+    """Parse a size like ``500MB`` or ``2G`` (or a number of bytes) to bytes"""
+    if isinstance(value, int):
+        return value
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", value.upper())
+    if not match:
+        raise ValueError(f"Invalid size: {value!r}")
+    number, unit = match.groups()
+    return int(float(number) * SIZE_UNITS[unit])
+
+
+def parse_age(value):
+    """Parse an age like ``30d``, ``12h`` or ``90m`` (or seconds) to seconds"""
+    if isinstance(value, (int, float)):
+        return value
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([SMHDW]?)\s*", value.upper())
+    if not match:
+        raise ValueError(f"Invalid age: {value!r}")
+    number, unit = match.groups()
+    return int(float(number) * AGE_UNITS[unit])
+
+
+def load_builds(cache_dir):
+    """Return the recorded builds, oldest first"""
+    try:
+        path = pathlib.Path(cache_dir) / BUILDS_FILENAME
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return []
+
+
+def record_build(cache_dir, build):
+    """Record a build and return all the recorded builds
+
+    A build is a dict with the ``start`` timestamp, the number of ``hits`` and
+    ``misses`` and the ``pages``: a mapping of the cache keys to the notebooks.
+    Only the last build keeps its pages.
+    """
+    builds = load_builds(cache_dir)
+    for old_build in builds:
+        old_build.pop("pages", None)
+    builds = [*builds, build][-MAX_BUILDS:]
+    path = pathlib.Path(cache_dir) / BUILDS_FILENAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(builds), encoding="utf-8")
+    return builds
+
+
+class JSONStore:
+    """One JSON file per entry, the modification time is the last use
+
+    Reading an entry does not update its last use, `touch` does it for the
+    entries used in a build.
+    """
+
+    def __init__(self, cache_dir, readonly=False):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.readonly = readonly
+
+    def __contains__(self, key):
+        return _get_cache_path(self.cache_dir, key).exists()
+
+    def get(self, key):
+        path = _get_cache_path(self.cache_dir, key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        return entry
+
+    def put(self, key, entry):
+        path = _get_cache_path(self.cache_dir, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(entry), encoding="utf-8")
+
+    def entries(self):
+        """Return a list of (key, size, last_used) for all the entries"""
+        if not self.cache_dir.is_dir():
+            return []
+        ret = []
+        for path in self.cache_dir.glob("*.json"):
+            if path.name in RESERVED_FILENAMES:
+                continue
+            stat = path.stat()
+            ret.append((path.stem, stat.st_size, stat.st_mtime))
+        return ret
+
+    def touch(self, keys):
+        for key in keys:
+            path = _get_cache_path(self.cache_dir, key)
+            if path.exists():
+                os.utime(path)
+
+    def delete(self, key):
+        _get_cache_path(self.cache_dir, key).unlink(missing_ok=True)
+
+    def close(self):
+        pass
+
+
+class SQLiteStore:
+    """Entries in an SQLite database with the HTML compressed with zlib"""
+
+    def __init__(self, cache_dir, readonly=False):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.readonly = readonly
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None and self.readonly:
+            path = (self.cache_dir / SQLITE_FILENAME).resolve()
+            self._conn = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True)
+        if self._conn is None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.cache_dir / SQLITE_FILENAME)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " content BLOB NOT NULL,"
+                " toc_tokens TEXT NOT NULL,"
+                " title TEXT,"
+                " size INTEGER NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " outputs TEXT NOT NULL DEFAULT '[]')"
+            )
+            columns = [
+                row[1] for row in self._conn.execute("PRAGMA table_info(entries)")
+            ]
+            if "outputs" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE entries ADD COLUMN outputs TEXT NOT NULL DEFAULT '[]'"
+                )
+        return self._conn
+
+    def __contains__(self, key):
+        row = self.conn.execute(
+            "SELECT 1 FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        return row is not None
+
+    def get(self, key):
+        row = self.conn.execute(
+            "SELECT content, toc_tokens, title, outputs FROM entries WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        content, toc_tokens, title, outputs = row
+        return {
+            "content": zlib.decompress(content).decode("utf-8"),
+            "toc_tokens": json.loads(toc_tokens),
+            "title": title,
+            "outputs": json.loads(outputs),
+        }
+
+    def put(self, key, entry):
+        content = zlib.compress(entry["content"].encode("utf-8"))
+        toc_tokens = json.dumps(entry["toc_tokens"])
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    content,
+                    toc_tokens,
+                    entry["title"],
+                    len(content) + len(toc_tokens),
+                    time.time(),
+                    json.dumps(entry.get("outputs", [])),
+                ),
+            )
+
+    def entries(self):
+        """Return a list of (key, size, last_used) for all the entries"""
+        return self.conn.execute("SELECT key, size, last_used FROM entries").fetchall()
+
+    def touch(self, keys):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(now, key) for key in keys],
+            )
+
+    def delete(self, key):
+        with self.conn:
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def merge(self, path):
+        """Add the entries of another SQLite store that are not in this one"""
+        conn = self.conn
+        conn.execute("ATTACH DATABASE ? AS other", (str(path),))
+        try:
+            with conn:
+                other_columns = [
+                    row[1] for row in conn.execute("PRAGMA other.table_info(entries)")
+                ]
+                outputs = "outputs" if "outputs" in other_columns else "'[]'"
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO entries"
+                    f" SELECT key, content, toc_tokens, title, size, ?, {outputs}"
+                    " FROM other.entries",
+                    (time.time(),),
+                )
+            return cursor.rowcount
+        finally:
+            conn.execute("DETACH DATABASE other")
+
+
+class LayeredStore:
+    """A local store with read-only shared stores behind it
+
+    Entries are read from the local store first and then from the shared
+    stores, in order. Entries found in a shared store are copied to the local
+    store. Writes and evictions only affect the local store.
+    """
+
+    def __init__(self, local, shared):
+        self.local = local
+        self.shared = shared
+
+    def __contains__(self, key):
+        return key in self.local or any(key in store for store in self.shared)
+
+    def get(self, key):
+        entry = self.local.get(key)
+        if entry is not None:
+            return entry
+        for store in self.shared:
+            entry = store.get(key)
+            if entry is not None:
+                logger.info("Shared cache hit: %s", store.cache_dir)
+                if not self._copy_outputs(store.cache_dir, entry):
+                    continue
+                self.local.put(key, entry)
+                return entry
+        return None
+
+    def put(self, key, entry):
+        self.local.put(key, entry)
+
+    def _copy_outputs(self, shared_dir, entry):
+        """Copy the outputs of an entry from a shared directory"""
+        for name in entry.get("outputs", []):
+            src = pathlib.Path(shared_dir) / OUTPUTS_DIRNAME / name
+            dest = self.local.cache_dir / OUTPUTS_DIRNAME / name
+            if dest.exists():
+                continue
+            if not src.exists():
+                return False
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(src, dest)
+        return True
+
+    def entries(self):
+        return self.local.entries()
+
+    def touch(self, keys):
+        self.local.touch(keys)
+
+    def delete(self, key):
+        self.local.delete(key)
+
+    def close(self):
+        self.local.close()
+        for store in self.shared:
+            store.close()
+
+
+class MemoryCache:
+    """A bounded LRU of entries in memory"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def evict(store, used_keys, max_size=0, keep_builds=0, max_age=0, builds=()):
+    """Evict entries from a store
+
+    Entries in used_keys are never evicted. Without any retention policy all
+    the other entries are evicted. Otherwise an entry is evicted when:
+
+    - keep_builds: it was not used in any of the last keep_builds builds
+    - max_age: it was not used in the last max_age seconds
+    - max_size: it is one of the least recently used entries that make the
+      total size of the store go over max_size
+    """
+    entries = store.entries()
+    if not (max_size or keep_builds or max_age):
+        stale = [key for key, _, _ in entries if key not in used_keys]
+    else:
+        cutoff = _get_cutoff(keep_builds, max_age, builds)
+        stale = [
+            key
+            for key, _, last_used in entries
+            if last_used < cutoff and key not in used_keys
+        ]
+        if max_size:
+            stale_keys = set(stale)
+            entries = [entry for entry in entries if entry[0] not in stale_keys]
+            total = sum(size for _, size, _ in entries)
+            for key, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                if total <= max_size:
+                    break
+                if key in used_keys:
+                    continue
+                stale.append(key)
+                total -= size
+    for key in stale:
+        store.delete(key)
+        logger.info("Evicted stale cache: %s", key)
+    return stale
+
+
+def evict_cells(cache_dir, keep_builds=0, max_age=0, builds=()):
+    """Evict the cell cache entries that were not used recently
+
+    The cell cache is only evicted with a keep_builds or max_age policy.
+    """
+    cells_dir = pathlib.Path(cache_dir) / CELLS_DIRNAME
+    if not ((keep_builds or max_age) and cells_dir.is_dir()):
+        return []
+    cutoff = _get_cutoff(keep_builds, max_age, builds)
+    stale = []
+    for path in cells_dir.glob("*.json"):
+        if path.stat().st_mtime < cutoff:
+            path.unlink()
+            stale.append(path.stem)
+    if stale:
+        logger.info("Evicted %s stale cell cache entries", len(stale))
+    return stale
+
+
+def load_executed(path, shared_dirs=()):
+    """Return the executed notebook cached at path or None
+
+    When it is not at path it is read from the ``executed`` directory of the
+    shared_dirs and copied to path.
+    """
+    try:
+        return nbformat.read(path, as_version=4)
+    except (OSError, ValueError):
+        pass
+    for shared_dir in shared_dirs:
+        shared_path = (
+            pathlib.Path(shared_dir) / EXECUTED_DIRNAME / pathlib.Path(path).name
+        )
+        try:
+            nb = nbformat.read(shared_path, as_version=4)
+        except (OSError, ValueError):
+            continue
+        logger.info("Shared executed notebook hit: %s", shared_dir)
+        save_executed(path, nb)
+        return nb
+    return None
+
+
+def save_executed(path, nb):
+    """Cache an executed notebook at path"""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Notebooks can be executed in parallel, write the file in one step
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    nbformat.write(nb, str(tmp_path))
+    os.replace(tmp_path, path)
+
+
+def evict_executed(cache_dir, used_keys, keep_builds=0, max_age=0, builds=()):
+    """Evict the executed notebooks
+
+    Without a keep_builds or max_age policy the notebooks not in used_keys are
+    evicted, the same as `evict`.
+    """
+    executed_dir = pathlib.Path(cache_dir) / EXECUTED_DIRNAME
+    used_names = {f"{key}.ipynb" for key in used_keys}
+    stale = _evict_files(executed_dir, used_names, keep_builds, max_age, builds)
+    if stale:
+        logger.info("Evicted %s stale executed notebooks", len(stale))
+    return [name[: -len(".ipynb")] for name in stale]
+
+
+def evict_outputs(cache_dir, used_names, keep_builds=0, max_age=0, builds=()):
+    """Evict the extracted outputs
+
+    Same policies as `evict_executed` for the output files in used_names.
+    """
+    outputs_dir = pathlib.Path(cache_dir) / OUTPUTS_DIRNAME
+    stale = _evict_files(outputs_dir, used_names, keep_builds, max_age, builds)
+    if stale:
+        logger.info("Evicted %s stale outputs", len(stale))
+    return stale
+
+
+def _evict_files(directory, used_names, keep_builds, max_age, builds):
+    if not directory.is_dir():
+        return []
+    policy = keep_builds or max_age
+    cutoff = _get_cutoff(keep_builds, max_age, builds)
+    stale = []
+    for path in directory.iterdir():
+        if path.name in used_names:
+            path.touch()
+        elif not policy or path.stat().st_mtime < cutoff:
+            path.unlink()
+            stale.append(path.name)
+    return stale
+
+
+def get_executed_path(cache_dir, key):
+    """Return the Path of the executed notebook for a key"""
+    return pathlib.Path(cache_dir) / EXECUTED_DIRNAME / f"{key}.ipynb"
+
+
+def _get_cutoff(keep_builds, max_age, builds):
+    """Entries last used before the returned timestamp are stale"""
+    cutoff = float("-inf")
+    if keep_builds and len(builds) >= keep_builds:
+        cutoff = builds[-keep_builds]["start"]
+    if max_age:
+        cutoff = max(cutoff, time.time() - max_age)
+    return cutoff
+
+
+def get_stores(cache_dir, readonly=False):
+    """Return the stores that exist in a cache directory"""
+    stores = [JSONStore(cache_dir, readonly=readonly)]
+    if (pathlib.Path(cache_dir) / SQLITE_FILENAME).exists():
+        stores.append(SQLiteStore(cache_dir, readonly=readonly))
+    return stores
+
+
+def export_cache(cache_dir, archive):
+    """Write the entries and the cell cache of a cache directory to a .tar.gz
+
+    The manifest and the builds are local to a machine and not exported.
+    Returns the number of exported files.
+    """
+    cache_dir = pathlib.Path(cache_dir)
+    archive = pathlib.Path(archive).resolve()
+    count = 0
+    with tarfile.open(archive, "w:gz") as tar:
+        for path in sorted(cache_dir.rglob("*")):
+            arcname = path.relative_to(cache_dir)
+            if not path.is_file() or path.resolve() == archive:
+                continue
+            if str(arcname) in RESERVED_FILENAMES:
+                continue
+            tar.add(path, arcname=arcname.as_posix())
+            count += 1
+    return count
+
+
+def import_cache(cache_dir, archive):
+    """Add the entries of an archive from ``export_cache`` to a cache directory
+
+    Entries that are already in the cache directory are kept.
+    Returns the number of imported entries.
+    """
+    cache_dir = pathlib.Path(cache_dir)
+    count = 0
+    with tempfile.TemporaryDirectory() as tmp_dir, tarfile.open(archive) as tar:
+        members = [
+            member
+            for member in tar.getmembers()
+            if member.isfile() and _is_safe_member(member.name)
+        ]
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(tmp_dir, members=members, filter="data")
+        else:
+            tar.extractall(tmp_dir, members=members)
+
+        tmp_dir = pathlib.Path(tmp_dir)
+        for path in sorted(tmp_dir.rglob("*")):
+            arcname = path.relative_to(tmp_dir)
+            if not path.is_file() or str(arcname) in RESERVED_FILENAMES:
+                continue
+            if str(arcname) == SQLITE_FILENAME:
+                store = SQLiteStore(cache_dir)
+                count += store.merge(path)
+                store.close()
+                continue
+            dest = cache_dir / arcname
+            if dest.exists():
+                continue
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(path), dest)
+            # Imported entries count as used now for the retention policies
+            os.utime(dest)
+            count += 1
+    return count
+
+
+def _is_safe_member(name):
+    path = pathlib.PurePosixPath(name)
+    return not path.is_absolute() and ".." not in path.parts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m mkdocs_jupyter.cache",
+        description="Inspect and clean the mkdocs-jupyter cache",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=".cache/mkdocs-jupyter",
+        help="Cache directory (default: %(default)s)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stats_parser = subparsers.add_parser("stats", help="Show cache statistics")
+    stats_parser.add_argument(
+        "--top", type=int, default=10, help="Number of largest entries to show"
+    )
+    gc_parser = subparsers.add_parser("gc", help="Evict stale cache entries")
+    gc_parser.add_argument(
+        "--keep-builds",
+        type=int,
+        default=0,
+        help="Keep the entries used in the last N builds",
+    )
+    gc_parser.add_argument(
+        "--max-age", default=0, help="Keep the entries used recently, e.g. 30d"
+    )
+    gc_parser.add_argument(
+        "--max-size", default=0, help="Maximum size of the cache, e.g. 500MB"
+    )
+    export_parser = subparsers.add_parser(
+        "export", help="Export the cache to a .tar.gz archive"
+    )
+    export_parser.add_argument("archive", help="Path of the archive")
+    import_parser = subparsers.add_parser(
+        "import", help="Import the entries of an exported archive"
+    )
+    import_parser.add_argument("archive", help="Path of the archive")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        count = import_cache(args.cache_dir, args.archive)
+        print(f"Imported {count} entries to {args.cache_dir}")
+        return 0
+
+    if not pathlib.Path(args.cache_dir).is_dir():
+        parser.error(f"Cache directory does not exist: {args.cache_dir}")
+
+    if args.command == "stats":
+        _print_stats(args.cache_dir, args.top)
+    elif args.command == "export":
+        count = export_cache(args.cache_dir, args.archive)
+        print(f"Exported {count} files to {args.archive}")
+    else:
+        try:
+            max_age = parse_age(args.max_age)
+            max_size = parse_size(args.max_size)
+        except ValueError as e:
+            parser.error(str(e))
+        if not (args.keep_builds or max_age or max_size):
+            parser.error("gc requires --keep-builds, --max-age or --max-size")
+        builds = load_builds(args.cache_dir)
+        for store in get_stores(args.cache_dir):
+            stale = evict(
+                store,
+                set(),
+                max_size=max_size,
+                keep_builds=args.keep_builds,
+                max_age=max_age,
+                builds=builds,
+            )
+            print(f"{type(store).__name__}: evicted {len(stale)} entries")
+            store.close()
+        stale = evict_cells(args.cache_dir, args.keep_builds, max_age, builds)
+        print(f"Cell cache: evicted {len(stale)} entries")
+        # Executed notebooks are only evicted by age, max_size is for the pages
+        if args.keep_builds or max_age:
+            stale = evict_executed(
+                args.cache_dir, set(), args.keep_builds, max_age, builds
+            )
+            print(f"Executed notebooks: evicted {len(stale)} entries")
+        # The outputs of the remaining pages are kept
+        stale = evict_outputs(
+            args.cache_dir,
+            _get_linked_outputs(args.cache_dir),
+            args.keep_builds,
+            max_age,
+            builds,
+        )
+        print(f"Outputs: evicted {len(stale)} files")
+    return 0
+
+
+def _get_linked_outputs(cache_dir):
+    """Return the names of the outputs linked from the entries of the stores"""
+    names = set()
+    # Read-only so reading the entries does not count as a use
+    for store in get_stores(cache_dir, readonly=True):
+        for key, _, _ in store.entries():
+            entry = store.get(key)
+            if entry is not None:
+                names.update(entry.get("outputs", []))
+        store.close()
+    return names
+
+
+def _print_stats(cache_dir, top):
+    builds = load_builds(cache_dir)
+    pages = builds[-1].get("pages", {}) if builds else {}
+
+    entries = []
+    for store in get_stores(cache_dir):
+        entries.extend(store.entries())
+        store.close()
+    total = sum(size for _, size, _ in entries)
+    print(f"Cache directory: {cache_dir}")
+    print(f"Entries: {len(entries)} ({_format_size(total)})")
+    if entries:
+        print(f"Average entry: {_format_size(total // len(entries))}")
+    for name, dirname in (
+        ("Executed notebooks", EXECUTED_DIRNAME),
+        ("Outputs", OUTPUTS_DIRNAME),
+        ("Cell cache", CELLS_DIRNAME),
+    ):
+        directory = pathlib.Path(cache_dir) / dirname
+        sizes = [path.stat().st_size for path in directory.glob("*") if path.is_file()]
+        if sizes:
+            print(f"{name}: {len(sizes)} ({_format_size(sum(sizes))})")
+
+    if builds:
+        hits = sum(build["hits"] for build in builds)
+        misses = sum(build["misses"] for build in builds)
+        last = builds[-1]
+        start = datetime.datetime.fromtimestamp(last["start"])
+        print(f"Last build: {start:%Y-%m-%d %H:%M:%S}", end=" ")
+        print(f"({last['hits']} hits, {last['misses']} misses)")
+        print(f"Last {len(builds)} builds: {hits} hits, {misses} misses")
+
+    largest = sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]
+    if largest:
+        print("Largest entries:")
+    for key, size, _ in largest:
+        print(f"  {_format_size(size):>10}  {key[:12]}  {pages.get(key, '')}")
+
+
+def _format_size(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _get_cache_path(cache_dir, cache_key):
+    """Return the Path for a given cache key."""
+    return pathlib.Path(cache_dir) / f"{cache_key}.json"
+
+
+if __name__ == "__main__":
+    sys.exit(main())
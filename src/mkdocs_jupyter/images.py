@@ -0,0 +1,106 @@
+"""
+Optimization of the image outputs extracted by `preprocessors.ExtractOutputs`
+
+Raster images (PNG and JPEG) are downscaled to a maximum width and re-encoded
+with Pillow, PNG images losslessly or as WebP. SVG images are minified.
+Pillow is optional, without it only SVG images are optimized.
+"""
+
+import io
+import logging
+import re
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger("mkdocs.mkdocs-jupyter")
+
+_warned_pillow = False
+
+
+def optimize_image(data, mimetype, max_width=0, webp=False):
+    """
+    Optimize an image
+
+    Arguments
+    ---------
+        data: bytes
+            Content of the image
+        mimetype: str
+            image/png, image/jpeg or image/svg+xml
+        max_width: int
+            Downscale raster images wider than this (default: 0, no limit)
+        webp: bool
+            Encode raster images as lossless WebP (default: False)
+    Returns
+    -------
+        The optimized image and its extension, the original image if it
+        could not be made smaller
+    """
+    extension = get_extension(mimetype, webp)
+    if mimetype == "image/svg+xml":
+        return minify_svg(data), extension
+    if not has_pillow():
+        return data, extension
+
+    resized = False
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        if max_width and image.width > max_width:
+            height = round(image.height * max_width / image.width)
+            image = image.resize((max_width, height), Image.LANCZOS)
+            resized = True
+        out = io.BytesIO()
+        if webp:
+            image.save(out, format="WEBP", lossless=True, method=6)
+        elif mimetype == "image/png":
+            image.save(out, format="PNG", optimize=True)
+        else:
+            image.save(out, format="JPEG", quality=85, optimize=True)
+    except Exception as e:
+        logger.warning("Could not optimize image: %s", e)
+        return data, get_extension(mimetype)
+
+    optimized = out.getvalue()
+    if len(optimized) >= len(data) and not (resized or webp):
+        return data, extension
+    return optimized, extension
+
+
+def get_extension(mimetype, webp=False):
+    """File extension of an image once optimized"""
+    if mimetype == "image/svg+xml":
+        return ".svg"
+    if webp and has_pillow():
+        return ".webp"
+    return ".png" if mimetype == "image/png" else ".jpg"
+
+
+def minify_svg(data):
+    """Remove the comments, metadata and indentation between tags of an SVG
+
+    The whitespace inside ``<text>`` elements is kept, it can be rendered
+    (e.g. between ``<tspan>`` elements).
+    """
+    svg = data.decode("utf-8")
+    svg = re.sub(r"<!--.*?-->", "", svg, flags=re.DOTALL)
+    svg = re.sub(r"<metadata.*?</metadata>", "", svg, flags=re.DOTALL)
+    svg = re.sub(
+        r"(<text\b.*?</text>)|(?<=>)\s*\n\s*(?=<)",
+        lambda match: match.group(1) or "",
+        svg,
+        flags=re.DOTALL,
+    )
+    return svg.strip().encode("utf-8")
+
+
+def has_pillow():
+    """Whether Pillow is installed, logs a warning the first time it is not"""
+    global _warned_pillow
+    if Image is None and not _warned_pillow:
+        logger.warning("Install Pillow to optimize PNG and JPEG outputs")
+        _warned_pillow = True
+    return Image is not None
@@ -0,0 +1,123 @@
+"""
+A pool of warm Jupyter kernels
+
+Starting a kernel (and importing heavy libraries in it) is a big part of the
+time it takes to execute a notebook. The pool keeps kernels alive after a
+notebook is executed so the next notebook that uses the same kernel can reuse
+it. The pool is a module level singleton so it survives `mkdocs serve` rebuilds.
+"""
+
+import atexit
+import logging
+
+from jupyter_client.blocking import BlockingKernelClient
+from jupyter_client.manager import KernelManager
+
+logger = logging.getLogger("mkdocs.mkdocs-jupyter")
+
+# Clears the user namespace but keeps imported modules warm
+IPYTHON_RESET_CODE = """\
+get_ipython().run_line_magic("reset", "-f")
+import os as __os
+__os.chdir({cwd!r})
+del __os
+"""
+
+
+class KernelPool:
+    """Pre-started kernels keyed by kernel name and warm-up code"""
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self._idle = {}
+
+    def acquire(self, kernel_name, cwd=None, reset="reset", warmup=""):
+        """Return a running kernel manager ready to execute a new notebook
+
+        Arguments
+        ---------
+            kernel_name: str
+                Name of the kernel, empty for the default kernel
+            cwd: str
+                Working directory for the notebook
+            reset: str
+                How to clean a kernel before it is reused: "reset" clears the
+                namespace of IPython kernels (other kernels are restarted),
+                "restart" always restarts the kernel
+            warmup: str
+                Code that is executed on every kernel before a notebook
+        """
+        idle = self._idle.setdefault((kernel_name, warmup), [])
+        while idle:
+            km = idle.pop()
+            if not km.is_alive():
+                km.cleanup_resources()
+                continue
+            try:
+                self._clean(km, cwd, reset, warmup)
+                logger.info("Reusing kernel from pool: %s", kernel_name or "default")
+                return km
+            except Exception:
+                logger.warning("Could not reset pooled kernel, starting a new one")
+                self._shutdown(km)
+
+        km = KernelManager(
+            client_class="jupyter_client.asynchronous.AsyncKernelClient",
+        )
+        if kernel_name:
+            km.kernel_name = kernel_name
+        logger.info("Starting kernel for pool: %s", kernel_name or "default")
+        km.start_kernel(cwd=cwd)
+        self._run(km, warmup)
+        return km
+
+    def release(self, kernel_name, km, warmup="", discard=False):
+        """Return a kernel to the pool so it can be reused"""
+        if discard or not km.is_alive():
+            self._shutdown(km)
+            return
+        self._idle.setdefault((kernel_name, warmup), []).append(km)
+
+    def shutdown(self):
+        """Shutdown all the idle kernels"""
+        for kms in self._idle.values():
+            for km in kms:
+                self._shutdown(km)
+        self._idle = {}
+
+    def _clean(self, km, cwd, reset, warmup):
+        language = km.kernel_spec.language if km.kernel_spec else ""
+        if reset == "reset" and language == "python":
+            self._run(km, IPYTHON_RESET_CODE.format(cwd=cwd or "."))
+        else:
+            km.restart_kernel(now=True, cwd=cwd)
+        # Modules imported before a reset are still loaded so this is cheap
+        self._run(km, warmup)
+
+    def _run(self, km, code):
+        if not code:
+            return
+        kc = BlockingKernelClient(connection_file=km.connection_file)
+        kc.load_connection_file()
+        kc.start_channels()
+        try:
+            kc.wait_for_ready(timeout=self.timeout)
+            reply = kc.execute_interactive(
+                code, timeout=self.timeout, output_hook=lambda msg: None
+            )
+            if reply["content"]["status"] != "ok":
+                logger.warning(
+                    "Kernel code failed: %s", reply["content"].get("evalue", "")
+                )
+        finally:
+            kc.stop_channels()
+
+    def _shutdown(self, km):
+        try:
+            km.shutdown_kernel(now=True)
+        except Exception:
+            km.cleanup_resources()
+
+
+kernel_pool = KernelPool()
+atexit.register(kernel_pool.shutdown)
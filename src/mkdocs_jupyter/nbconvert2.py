@@ -4,7 +4,7 @@ It provides a cleaner / more self-contained version of the HTML content
 that can be embedded into existing HTML pages without breaking existing styles
 """
 
-import io
+import functools
 import json
 import logging
 import os
@@ -12,19 +12,29 @@ import re
 
 import jupytext
 import mistune
+import nbformat
 from nbconvert.exporters.html import HTMLExporter
 from nbconvert.exporters.markdown import MarkdownExporter
 from nbconvert.exporters.templateexporter import default_filters
-from nbconvert.filters.highlight import _pygments_highlight
 from nbconvert.filters.markdown_mistune import IPythonRenderer, MarkdownWithMath
 from nbconvert.nbconvertapp import NbConvertApp
+from nbconvert.preprocessors import ExecutePreprocessor
 from pygments import highlight
 from pygments.formatters import HtmlFormatter
 from pygments.lexers import get_lexer_by_name
+from pygments.lexers.special import TextLexer
 from pygments.util import ClassNotFound
+from traitlets.utils.importstring import import_item
 
+from mkdocs_jupyter import cache, timing
 from mkdocs_jupyter.config import settings
-from mkdocs_jupyter.preprocessors import SubCell
+from mkdocs_jupyter.preprocessors import (
+    Execute,
+    ExtractOutputs,
+    SubCell,
+    TruncateOutputs,
+    WidgetState,
+)
 
 logger = logging.getLogger("mkdocs.mkdocs-jupyter")
 
@@ -34,7 +44,31 @@ kernel_lang = "python"
 # We use this to tag each div with code with an unique ID for the copy-to-clipboard
 cell_id = 0
 
+MATHJAX_URL = "https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/latest.js?config=TeX-AMS_CHTML-full,Safe"
 
+# Number of highlighted code cells kept in memory
+HIGHLIGHT_CACHE_SIZE = 1024
+
+# Number of exporters kept in memory
+EXPORTER_CACHE_SIZE = 16
+
+# Creating an exporter (traitlets config, Jinja environment and templates) is
+# expensive so they are shared by all the notebooks with the same options (and
+# so are the preprocessors of `execute_notebook`). The least recently used ones
+# are dropped, e.g. after config edits in mkdocs serve
+_exporters = cache.MemoryCache(EXPORTER_CACHE_SIZE)
+
+
+# Ensures SVG rendered with data and rdkit exit with NOOP
+# Source: https://github.com/jupyter/nbconvert/issues/1894#issuecomment-1334355109
+def custom_clean_html(element):
+    return element.decode() if isinstance(element, bytes) else str(element)
+
+
+default_filters["clean_html"] = custom_clean_html
+
+
+@timing.timed("export")
 def nb2html(
     nb_path,
     execute=False,
@@ -48,8 +82,21 @@ def nb2html(
     no_prompt: bool = False,
     remove_tag_config: dict = {},
     highlight_extra_classes: str = "",
+    include_clipboard_text: bool = True,
     include_requirejs: bool = False,
-    custom_mathjax_url: str = "https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/latest.js?config=TeX-AMS_CHTML-full,Safe",
+    custom_mathjax_url: str = MATHJAX_URL,
+    kernel_pool: bool = False,
+    kernel_pool_reset: str = "reset",
+    kernel_pool_warmup: str = "",
+    cell_cache_dir: str = "",
+    cell_cache_shared_dirs: list = (),
+    cell_cache_independent_tag: str = "cache-independent",
+    cell_cache_seed: str = "",
+    execute_timeout: int = 0,
+    execute_deadline: float = 0,
+    assets: dict = None,
+    outputs: dict = None,
+    nb=None,
 ):
     """
     Convert a notebook to HTML
@@ -78,6 +125,41 @@ def nb2html(
             Render notebook without input or output prompts (default: False)
         remove_tag_config: dict
             Configure rendering based on cell tags (default: {})
+        include_clipboard_text: bool
+            Include a hidden copy of the source of every code cell for the
+            copy button, otherwise it copies the highlighted code (default: True)
+        kernel_pool: bool
+            Execute on a warm kernel reused across notebooks (default: False)
+        kernel_pool_reset: str
+            How to clean a pooled kernel: reset or restart (default: reset)
+        kernel_pool_warmup: str
+            Code to run on every new pooled kernel (default: "")
+        cell_cache_dir: str
+            Directory to cache the outputs of the code cells, the notebook
+            is executed only from the first changed cell (default: "")
+        cell_cache_shared_dirs: list
+            Read-only cell cache directories (default: ())
+        cell_cache_independent_tag: str
+            Tag of the cells cached on their own source (default: cache-independent)
+        cell_cache_seed: str
+            Part of the cell cache keys, e.g. the digest of the files the
+            notebook depends on (default: "")
+        execute_timeout: int
+            Seconds to execute the notebook, 0 for no limit (default: 0)
+        execute_deadline: float
+            Timestamp when the execution of the notebooks of the build must
+            stop, 0 for no limit (default: 0)
+        assets: dict
+            URLs of the shared CSS and JS ({"css": [...], "js": [...]}) to link
+            instead of inlining them, see `get_html_assets` (default: None)
+        outputs: dict
+            Directory to write the image outputs and the large HTML outputs
+            to and its URL relative to the page ({"dir": ..., "url": ...})
+            instead of inlining them, see `ExtractOutputs`, `TruncateOutputs`
+            and `WidgetState` (default: None)
+        nb: NotebookNode
+            The notebook already read from `nb_path` with `read_notebook`
+            (default: None)
     Returns
     -------
         HTML content
@@ -87,7 +169,11 @@ def nb2html(
     global cell_id, kernel_lang
     cell_id = 0  # Reset the cell id
 
-    app = get_nbconvert_app(
+    exporter = get_html_exporter(
+        theme=theme,
+        highlight_extra_classes=highlight_extra_classes,
+        include_clipboard_text=include_clipboard_text,
+        custom_mathjax_url=custom_mathjax_url,
         execute=execute,
         kernel_name=kernel_name,
         start=start,
@@ -97,28 +183,207 @@ def nb2html(
         no_input=no_input,
         no_prompt=no_prompt,
         remove_tag_config=remove_tag_config,
+        kernel_pool=kernel_pool,
+        kernel_pool_reset=kernel_pool_reset,
+        kernel_pool_warmup=kernel_pool_warmup,
+        cell_cache_dir=cell_cache_dir,
+        cell_cache_shared_dirs=cell_cache_shared_dirs,
+        cell_cache_independent_tag=cell_cache_independent_tag,
+        execute_timeout=execute_timeout,
+    )
+
+    if nb is None:
+        nb = read_notebook(nb_path)
+
+    resources = {
+        "mkdocs": {
+            "test": "value",
+            "include_requirejs": include_requirejs,
+            "assets": assets,
+            "outputs": outputs,
+            # Not exporter options, they change with every build or notebook
+            "execute_deadline": execute_deadline,
+            "cell_cache_seed": cell_cache_seed,
+        }
+    }
+
+    _, extension = os.path.splitext(nb_path)
+
+    if extension in (".py", ".md"):
+        content, resources = exporter.from_notebook_node(nb, resources=resources)
+    else:
+        try:
+            kernel_lang = nb["metadata"]["kernelspec"]["language"]
+        except KeyError:
+            pass
+        # Same metadata that from_filename adds, used as the execution path
+        path, basename = os.path.split(nb_path)
+        resources["metadata"] = {
+            "name": os.path.splitext(basename)[0],
+            "path": path,
+        }
+        content, resources = exporter.from_notebook_node(nb, resources=resources)
+        if not assets:
+            content = (
+                content
+                + f"""
+        <style>
+        {resources["inlining"]["css"]}
+        </style>
+        """
+            )
+
+    if highlight_extra_classes:
+        content = content.replace(
+            "jp-OutputArea-output",
+            f"jp-OutputArea-output {highlight_extra_classes}",
+        )
+
+    return content
+
+
+def nbs2html(nb_paths, **kwargs):
+    """
+    Convert many notebooks to HTML
+
+    All the notebooks share the same exporter.
+    Takes the same keyword arguments as `nb2html`.
+
+    Returns
+    -------
+        list of HTML content, in the same order as `nb_paths`
+    """
+    return [nb2html(nb_path, **kwargs) for nb_path in nb_paths]
+
+
+def execute_notebook(
+    nb_path,
+    nb=None,
+    kernel_name="",
+    allow_errors=True,
+    remove_tag_config: dict = None,
+    kernel_pool: bool = False,
+    kernel_pool_reset: str = "reset",
+    kernel_pool_warmup: str = "",
+    cell_cache_dir: str = "",
+    cell_cache_shared_dirs: list = (),
+    cell_cache_independent_tag: str = "cache-independent",
+    cell_cache_seed: str = "",
+    execute_timeout: int = 0,
+    execute_deadline: float = 0,
+):
+    """
+    Execute a notebook the same way `nb2html` does
+
+    The executed notebook can be converted with `nb2html(execute=False, nb=...)`.
+    Takes the execution keyword arguments of `nb2html` and remove_tag_config,
+    the cells removed by tags are not executed.
+
+    Returns
+    -------
+        The executed NotebookNode
+    """
+    logger.info(f"Executing notebook: {nb_path}")
+
+    if nb is None:
+        nb = read_notebook(nb_path)
+
+    preprocessors = get_execute_preprocessors(
+        kernel_name=kernel_name,
+        allow_errors=allow_errors,
+        remove_tag_config=remove_tag_config or {},
+        kernel_pool=kernel_pool,
+        kernel_pool_reset=kernel_pool_reset,
+        kernel_pool_warmup=kernel_pool_warmup,
+        cell_cache_dir=cell_cache_dir,
+        cell_cache_shared_dirs=cell_cache_shared_dirs,
+        cell_cache_independent_tag=cell_cache_independent_tag,
+        execute_timeout=execute_timeout,
+    )
+    resources = {
+        "mkdocs": {
+            "execute_deadline": execute_deadline,
+            "cell_cache_seed": cell_cache_seed,
+        }
+    }
+    _, extension = os.path.splitext(nb_path)
+    if extension not in (".py", ".md"):
+        resources["metadata"] = {"path": os.path.dirname(nb_path)}
+    for preprocessor in preprocessors:
+        nb, resources = preprocessor(nb, resources)
+    return nb
+
+
+def get_execute_preprocessors(**app_kwargs):
+    """
+    Return the preprocessors used by `execute_notebook`
+
+    These are the preprocessors that run before the execution in `nb2html`:
+    the nbconvert defaults (e.g. TagRemovePreprocessor) and then Execute.
+    `app_kwargs` are passed to `get_nbconvert_app`.
+    """
+    key = ("execute", json.dumps(app_kwargs, sort_keys=True, default=repr))
+    preprocessors = _exporters.get(key)
+    if preprocessors is not None:
+        return preprocessors
+
+    # Same defaults and config as the exporter of nb2html
+    exporter = get_html_exporter(execute=True, **app_kwargs)
+    preprocessors = []
+    for preprocessor in exporter.default_preprocessors:
+        if isinstance(preprocessor, str):
+            preprocessor = import_item(preprocessor)
+        if issubclass(preprocessor, ExecutePreprocessor):
+            break
+        preprocessors.append(preprocessor(config=exporter.config))
+    preprocessors.append(Execute(config=exporter.config))
+    _exporters.put(key, preprocessors)
+    return preprocessors
+
+
+def get_html_exporter(
+    theme="light",
+    highlight_extra_classes="",
+    include_clipboard_text=True,
+    custom_mathjax_url=MATHJAX_URL,
+    **app_kwargs,
+) -> HTMLExporter:
+    """
+    Return the HTMLExporter used by `nb2html`
+
+    Exporters are created once for every distinct set of options and reused.
+    `app_kwargs` are passed to `get_nbconvert_app`.
+    """
+    key = (
+        "html",
+        theme,
+        highlight_extra_classes,
+        include_clipboard_text,
+        custom_mathjax_url,
+        json.dumps(app_kwargs, sort_keys=True, default=repr),
     )
+    exporter = _exporters.get(key)
+    if exporter is not None:
+        return exporter
+
+    app = get_nbconvert_app(**app_kwargs)
 
     # Use the templates included in this package
     template_file = "mkdocs_html/notebook.html.j2"
     extra_template_paths = [settings.templates_dir]
 
     # Customize NBConvert App
-    preprocessors_ = [SubCell]
+    preprocessors_ = [SubCell, TruncateOutputs, ExtractOutputs, WidgetState]
+    if app_kwargs.get("execute"):
+        preprocessors_.insert(0, Execute)
     filters = {
         "highlight_code": mk_custom_highlight_code(
-            extra_css_classes=highlight_extra_classes
+            extra_css_classes=highlight_extra_classes,
+            clipboard_text=include_clipboard_text,
         ),
         # "markdown2html": custom_markdown2html,
     }
 
-    # Ensures SVG rendered with data and rdkit exit with NOOP
-    # Source: https://github.com/jupyter/nbconvert/issues/1894#issuecomment-1334355109
-    def custom_clean_html(element):
-        return element.decode() if isinstance(element, bytes) else str(element)
-
-    default_filters["clean_html"] = custom_clean_html
-
     exporter = HTMLExporter(
         config=app.config,
         template_file=template_file,
@@ -128,53 +393,69 @@ def nb2html(
         theme=theme,
         mathjax_url=custom_mathjax_url,
     )
+    _exporters.put(key, exporter)
+    return exporter
 
+
+def get_html_assets(theme="light"):
+    """
+    Return the CSS and JS that `nb2html` inlines on every notebook
+
+    This allows writing them once as static files and passing their URLs
+    to `nb2html` using the `assets` argument.
+
+    Returns
+    -------
+        dict of {"css": content, "js": content}
+    """
+    from jupyter_core.paths import jupyter_config_dir
+    from nbconvert.preprocessors import CSSHTMLHeaderPreprocessor
+
+    app = get_nbconvert_app()
+    _, resources = CSSHTMLHeaderPreprocessor(config=app.config).preprocess(
+        None, {"config_dir": jupyter_config_dir()}
+    )
+
+    assets_dir = os.path.join(settings.templates_dir, "mkdocs_html", "assets")
+
+    def read_asset(name):
+        with open(os.path.join(assets_dir, name), encoding="utf-8") as f:
+            return f.read()
+
+    theme_css = "theme-dark.css" if theme == "dark" else "theme-light.css"
+    css = [
+        css.replace(".highlight ", ".highlight-ipynb ")
+        for css in resources["inlining"]["css"]
+    ]
+    css += [read_asset("index.css"), read_asset(theme_css)]
+    js = [
+        read_asset("clipboard.umd.js"),
+        read_asset("clipboard-notice.js"),
+        read_asset("lazy-output.js"),
+        read_asset("widget-state.js"),
+    ]
+    return {"css": "\n".join(css), "js": "\n".join(js)}
+
+
+@timing.timed("read")
+def read_notebook(nb_path):
+    """Read a notebook, .py and .md files are read using jupytext"""
     _, extension = os.path.splitext(nb_path)
 
     if extension in (".py", ".md"):
-        nb = jupytext.read(nb_path)
-        nb_file = io.StringIO(jupytext.writes(nb, fmt="ipynb"))
-        content, resources = exporter.from_file(
-            nb_file,
-            resources={
-                "mkdocs": {
-                    "test": "value",
-                    "include_requirejs": include_requirejs,
-                }
-            },
-        )
-    else:
-        try:
-            with open(nb_path, "r", encoding="utf-8") as f:
-                nb_json = json.load(f)
-                kernel_lang = nb_json["metadata"]["kernelspec"]["language"]
-        except KeyError:
-            pass
-        content, resources = exporter.from_filename(
-            nb_path,
-            resources={
-                "mkdocs": {
-                    "test": "value",
-                    "include_requirejs": include_requirejs,
-                }
-            },
-        )
-        content = (
-            content
-            + f"""
-        <style>
-        {resources["inlining"]["css"]}
-        </style>
-        """
-        )
+        return jupytext.read(nb_path)
+    return nbformat.read(nb_path, as_version=4)
 
-    if highlight_extra_classes:
-        content = content.replace(
-            "jp-OutputArea-output",
-            f"jp-OutputArea-output {highlight_extra_classes}",
-        )
 
-    return content
+@timing.timed("markdown")
+def nb_markdown(nb):
+    """Return the markdown of the notebook markdown cells
+
+    This is the same content as `nb2md` but it uses an already read
+    notebook instead of running a second export.
+    """
+    body = "\n\n".join(cell.source for cell in nb.cells if cell.cell_type == "markdown")
+    return _strip_code(body)
 
 
 def _strip_if_no_heading(m):
@@ -184,6 +465,7 @@ def _strip_if_no_heading(m):
     return ""
 
 
+@timing.timed("markdown")
 def nb2md(nb_path, start=0, end=None, execute=False, kernel_name=""):
     """Convert a notebook to markdown
 
@@ -191,29 +473,19 @@ def nb2md(nb_path, start=0, end=None, execute=False, kernel_name=""):
     is to big ( with javascript and CSS) it takes to long to read and parse
     """
 
-    app = get_nbconvert_app(
+    exporter = get_markdown_exporter(
         start=start, end=end, execute=execute, kernel_name=kernel_name
     )
-
-    # Use the templates included in this package
-    template_file = "mkdocs_md/md-no-codecell.md.j2"
-    extra_template_paths = [settings.templates_dir]
-
-    exporter = MarkdownExporter(
-        config=app.config,
-        template_file=template_file,
-        extra_template_paths=extra_template_paths,
-    )
-
+    resources = {}
     _, extension = os.path.splitext(nb_path)
+    if extension not in (".py", ".md"):
+        resources["metadata"] = {"path": os.path.dirname(nb_path)}
+    body, resources = exporter.from_notebook_node(read_notebook(nb_path), resources)
 
-    if extension in (".py", ".md"):
-        nb = jupytext.read(nb_path)
-        nb_file = io.StringIO(jupytext.writes(nb, fmt="ipynb"))
-        body, resources = exporter.from_file(nb_file)
-    else:
-        body, resources = exporter.from_filename(nb_path)
+    return _strip_code(body)
 
+
+def _strip_code(body):
     # Code cells can also be created using backquotes (text surrounded by up to three backquotes `)
     # So it needs to be removed, also to not mess the table of contents (for more see "test_toc.py")
 
@@ -231,6 +503,34 @@ def nb2md(nb_path, start=0, end=None, execute=False, kernel_name=""):
     return body
 
 
+def get_markdown_exporter(**app_kwargs) -> MarkdownExporter:
+    """
+    Return the MarkdownExporter used by `nb2md`
+
+    Exporters are created once for every distinct set of options and reused.
+    `app_kwargs` are passed to `get_nbconvert_app`.
+    """
+    key = ("markdown", json.dumps(app_kwargs, sort_keys=True, default=repr))
+    exporter = _exporters.get(key)
+    if exporter is not None:
+        return exporter
+
+    app = get_nbconvert_app(**app_kwargs)
+
+    # Use the templates included in this package
+    template_file = "mkdocs_md/md-no-codecell.md.j2"
+    extra_template_paths = [settings.templates_dir]
+
+    exporter = MarkdownExporter(
+        config=app.config,
+        template_file=template_file,
+        extra_template_paths=extra_template_paths,
+        preprocessors=[Execute] if app_kwargs.get("execute") else [],
+    )
+    _exporters.put(key, exporter)
+    return exporter
+
+
 def get_nbconvert_app(
     execute=False,
     kernel_name="",
@@ -241,6 +541,13 @@ def get_nbconvert_app(
     no_input: bool = False,
     no_prompt: bool = False,
     remove_tag_config: dict = {},
+    kernel_pool: bool = False,
+    kernel_pool_reset: str = "reset",
+    kernel_pool_warmup: str = "",
+    cell_cache_dir: str = "",
+    cell_cache_shared_dirs: list = (),
+    cell_cache_independent_tag: str = "cache-independent",
+    execute_timeout: int = 0,
 ) -> NbConvertApp:
     """Create"""
 
@@ -305,12 +612,25 @@ def get_nbconvert_app(
                 "highlight_class": ".highlight-ipynb",
             },
             "SubCell": {"enabled": True, "start": start, "end": end},
+            # Notebooks are executed by our Execute subclass
             "ExecutePreprocessor": {
-                "enabled": execute,
+                "enabled": False,
                 "store_widget_state": True,
                 "kernel_name": kernel_name,
                 "allow_errors": allow_errors,
             },
+            "Execute": {
+                # Execute reloads its config on every notebook (in
+                # NotebookClient.__init__), it must not inherit enabled=False
+                "enabled": True,
+                "kernel_pool": kernel_pool,
+                "reset": kernel_pool_reset,
+                "warmup": kernel_pool_warmup,
+                "cell_cache_dir": cell_cache_dir,
+                "cell_cache_shared_dirs": list(cell_cache_shared_dirs),
+                "independent_tag": cell_cache_independent_tag,
+                "notebook_timeout": execute_timeout,
+            },
             **template_exported_conf,
         }
     )
@@ -318,7 +638,7 @@ def get_nbconvert_app(
     return app
 
 
-def mk_custom_highlight_code(extra_css_classes=""):
+def mk_custom_highlight_code(extra_css_classes="", clipboard_text=True):
     def custom_highlight_code(source, language=None, metadata=None):
         """
         Change CSS class names from .highlight to .highlight-ipynb.
@@ -326,6 +646,9 @@ def mk_custom_highlight_code(extra_css_classes=""):
 
         This modifies only the HTML not CSS.
         On the `notebook.html.js` template we modify the CSS styles.
+
+        Without `clipboard_text` the copy button copies the text of the
+        highlighted code instead of a hidden copy of the source.
         """
         global cell_id
         cell_id = cell_id + 1
@@ -333,8 +656,17 @@ def mk_custom_highlight_code(extra_css_classes=""):
             language = kernel_lang
 
         classes = f"highlight-ipynb hl-{language} {extra_css_classes}"
-        formatter = HtmlFormatter(cssclass=classes)
-        output = _pygments_highlight(source, formatter, language, metadata)
+        # Same as the nbconvert highlight filter
+        if (
+            language.startswith("ipython")
+            and metadata
+            and "magics_language" in metadata
+        ):
+            language = metadata["magics_language"]
+        output = _highlight(source, language, classes)
+
+        if not clipboard_text:
+            return output.replace("<div ", f'<div id="cell-{cell_id}" ', 1)
 
         escaped = mistune.escape(source)
         clipboard_copy_txt = f"""<div id="cell-{cell_id}" class="clipboard-copy-txt">{escaped}</div>
@@ -344,6 +676,38 @@ def mk_custom_highlight_code(extra_css_classes=""):
     return custom_highlight_code
 
 
+@functools.lru_cache(maxsize=HIGHLIGHT_CACHE_SIZE)
+def _highlight(source, language, cssclass):
+    """Highlight the source of a code cell
+
+    The same cells (imports, setup code) repeat across notebooks so the
+    results are cached.
+    """
+    return highlight(source, _get_lexer(language), _get_formatter(cssclass))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_lexer(language):
+    """Return the Pygments lexer that the nbconvert highlight filter uses"""
+    if language in ("ipython2", "ipython3"):
+        try:
+            from IPython.lib.lexers import IPython3Lexer, IPythonLexer
+        except ModuleNotFoundError:
+            language = "python" if language == "ipython2" else "python3"
+        else:
+            return IPythonLexer() if language == "ipython2" else IPython3Lexer()
+    try:
+        return get_lexer_by_name(language)
+    except ClassNotFound:
+        logger.warning(f"No lexer found for language {language!r}, using plain text")
+        return TextLexer()
+
+
+@functools.lru_cache(maxsize=None)
+def _get_formatter(cssclass):
+    return HtmlFormatter(cssclass=cssclass)
+
+
 def custom_markdown2html(source):
     """
     This filter uses a Custom Rendered that uses a custom CodeHtmlFormatter
@@ -1,22 +1,38 @@
+import atexit
+import copy
+import glob
 import hashlib
 import json
 import logging
+import multiprocessing
 import os
 import pathlib
+import re
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
 
-import jupytext
 import markdown
 import mkdocs
+import yaml
 from markdown.extensions.toc import TocExtension
 from mkdocs.config import config_options
+from mkdocs.exceptions import PluginError
 from mkdocs.structure.files import File, Files
 from mkdocs.structure.pages import Page
 from mkdocs.structure.toc import get_toc
+from mkdocs.utils import get_relative_url, write_file
+from nbclient.exceptions import CellTimeoutError
 
-from . import convert
+from . import cache, convert, timing
+from .cache import MANIFEST_FILENAME
+from .kernels import kernel_pool
 
 logger = logging.getLogger("mkdocs.plugins.mkdocs_jupyter")
 
+# Where the extracted outputs are written in the site
+OUTPUTS_PATH = "assets/mkdocs-jupyter/outputs"
+
 
 class NotebookFile(File):
     """
@@ -37,12 +53,48 @@ class NotebookFile(File):
         return True
 
 
+class WorkerPool:
+    """The worker processes converting notebooks with the workers option
+
+    Shared by the plugin instances, mkdocs serve creates a new one every time
+    the config changes.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._workers = 0
+
+    def get(self, workers):
+        """Return the executor, started again if the number of workers changed"""
+        if self._executor is not None and self._workers != workers:
+            self.shutdown()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            self._workers = workers
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+worker_pool = WorkerPool()
+atexit.register(worker_pool.shutdown)
+
+
 class Plugin(mkdocs.plugins.BasePlugin):
     config_scheme = (
         ("include", config_options.Type(list, default=["*.py", "*.ipynb", "*.md"])),
         ("ignore", config_options.Type(list, default=[])),
-        ("execute", config_options.Type(bool, default=False)),
+        ("execute", config_options.Choice((True, False, "auto"), default=False)),
         ("execute_ignore", config_options.Type(list, default=[])),
+        ("execute_auto_marker", config_options.Type(str, default="")),
+        ("execute_timeout", config_options.Type((int, str), default=0)),
+        ("execute_build_timeout", config_options.Type((int, str), default=0)),
         ("theme", config_options.Type(str, default="")),
         ("kernel_name", config_options.Type(str, default="")),
         ("include_source", config_options.Type(bool, default=False)),
@@ -54,14 +106,59 @@ class Plugin(mkdocs.plugins.BasePlugin):
         ("remove_tag_config", config_options.Type(dict, default={})),
         ("highlight_extra_classes", config_options.Type(str, default="")),
         ("include_requirejs", config_options.Type(bool, default=False)),
+        ("include_clipboard_text", config_options.Type(bool, default=True)),
         ("toc_depth", config_options.Type(int, default=6)),
         ("data_files", config_options.Type(dict, default={})),
         ("custom_mathjax_url", config_options.Type(str, default="")),
         ("cache", config_options.Type(bool, default=True)),
         ("cache_dir", config_options.Type(str, default=".cache/mkdocs-jupyter")),
+        ("cache_verify", config_options.Type(bool, default=False)),
+        ("cache_backend", config_options.Choice(["json", "sqlite"], default="json")),
+        ("cache_max_size", config_options.Type((int, str), default=0)),
+        ("cache_max_age", config_options.Type((int, str), default=0)),
+        ("cache_keep_builds", config_options.Type(int, default=0)),
+        ("cache_shared_dirs", config_options.Type(list, default=[])),
+        ("cache_memory_entries", config_options.Type(int, default=128)),
+        ("workers", config_options.Type(int, default=0)),
+        ("kernel_pool", config_options.Type(bool, default=False)),
+        (
+            "kernel_pool_reset",
+            config_options.Choice(["reset", "restart"], default="reset"),
+        ),
+        ("kernel_pool_warmup", config_options.Type(str, default="")),
+        ("cell_cache", config_options.Type(bool, default=False)),
+        ("external_assets", config_options.Type(bool, default=False)),
+        ("extract_outputs", config_options.Type(bool, default=False)),
+        ("optimize_images", config_options.Type(bool, default=False)),
+        ("image_max_width", config_options.Type(int, default=0)),
+        ("image_webp", config_options.Type(bool, default=False)),
+        ("lazy_outputs", config_options.Type((int, str), default=0)),
+        ("output_max_lines", config_options.Type(int, default=0)),
+        ("output_max_bytes", config_options.Type((int, str), default=0)),
+        ("widget_state", config_options.Choice(("embed", "external"), default="embed")),
+        ("prune_widgets", config_options.Type(bool, default=False)),
+        ("timing_report", config_options.Type(str, default="")),
+        ("timing_memory", config_options.Type(bool, default=False)),
+        ("timing_top", config_options.Type(int, default=10)),
+        (
+            "cell_cache_independent_tag",
+            config_options.Type(str, default="cache-independent"),
+        ),
     )
     _supported_extensions = [".ipynb", ".py", ".md"]
 
+    def __init__(self):
+        super().__init__()
+        self._dirty = False
+        self._futures = {}
+        self._assets = None
+        self._classification = {}
+        # Kept across mkdocs serve rebuilds
+        self._memory = None
+        self._manifest = None
+        self._manifest_dir = None
+        self._auto_execute = {}
+
     def should_include(self, file):
         if file.abs_src_path is None:
             return False
@@ -73,13 +170,27 @@ class Plugin(mkdocs.plugins.BasePlugin):
             # check ignore patterns before attempting to read the file
             if srcpath.match(pattern):
                 return False
+
+        # The result is computed once per build for each version of the file
+        try:
+            stat = os.stat(file.abs_src_path)
+            index_key = (file.abs_src_path, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            index_key = (file.abs_src_path, None, None)
+        if index_key not in self._classification:
+            self._classification[index_key] = self._classify(srcpath, ext)
+        return self._classification[index_key]
+
+    def _classify(self, srcpath, ext):
         if ext == ".md":
             # only include markdown files with jupytext frontmatter
             # that explicitly specifies a python kernel
             try:
-                data = jupytext.read(file.abs_src_path)
+                meta = _read_front_matter(str(srcpath))
+                # jupytext markdown uses a jupyter key, MyST markdown does not
+                meta = meta.get("jupyter", meta)
                 if not (
-                    (meta := data.get("metadata", {}))
+                    meta
                     and (kernelspec := meta.get("kernelspec"))
                     and kernelspec["language"] == "python"
                 ):
@@ -91,8 +202,59 @@ class Plugin(mkdocs.plugins.BasePlugin):
                 return True
         return False
 
+    def on_startup(self, *, command, dirty):
+        self._dirty = dirty
+
+    def on_shutdown(self):
+        worker_pool.shutdown()
+        kernel_pool.shutdown()
+
     def on_pre_build(self, config):
-        self._used_cache_paths = set()
+        self._classification = {}
+        # Maps the cache keys used in this build to the notebooks
+        self._used_cache_keys = {}
+        self._cache_keys = {}
+        self._executed_keys = {}
+        self._dependencies = {}
+        self._used_executed_keys = set()
+        self._cache_stats = {"start": time.time(), "hits": 0, "misses": 0}
+        self._cache_hits = set()
+        self._used_outputs = set()
+        self._timings = {}
+        self._store = None
+        try:
+            self._lazy_outputs_size = cache.parse_size(self.config["lazy_outputs"])
+            self._output_max_bytes = cache.parse_size(self.config["output_max_bytes"])
+        except ValueError as e:
+            raise PluginError(f"Invalid outputs option: {e}") from None
+        try:
+            self._execute_timeout = cache.parse_age(self.config["execute_timeout"])
+            build_timeout = cache.parse_age(self.config["execute_build_timeout"])
+        except ValueError as e:
+            raise PluginError(f"Invalid execute option: {e}") from None
+        # The notebooks executed after this time fall back to their last outputs
+        self._execute_deadline = time.time() + build_timeout if build_timeout else 0
+        if not self.config["cache"]:
+            self._manifest = {}
+            self._manifest_dir = None
+        else:
+            try:
+                self._cache_max_size = cache.parse_size(self.config["cache_max_size"])
+                self._cache_max_age = cache.parse_age(self.config["cache_max_age"])
+            except ValueError as e:
+                raise PluginError(f"Invalid cache option: {e}") from None
+            if self._manifest_dir != self.config["cache_dir"]:
+                self._manifest = _load_manifest(self.config["cache_dir"])
+                self._manifest_dir = self.config["cache_dir"]
+                self._memory = None
+            if self._memory is None:
+                self._memory = cache.MemoryCache(self.config["cache_memory_entries"])
+            self._store = cache.get_store(
+                self.config["cache_backend"],
+                self.config["cache_dir"],
+                self.config["cache_shared_dirs"],
+            )
+        self._saved_manifest = dict(self._manifest)
 
     def on_files(self, files, config):
         ret = Files(
@@ -101,90 +263,380 @@ class Plugin(mkdocs.plugins.BasePlugin):
                 for file in files
             ]
         )
+        self._futures = {}
+        self._site_dir = config["site_dir"]
+        self._notebook_files = [file for file in ret if isinstance(file, NotebookFile)]
+        self._assets = None
+        if self.config["external_assets"]:
+            self._assets = _get_site_assets(self.config["theme"])
+        if self.config["workers"] > 1:
+            self._submit_notebooks(ret)
         return ret
 
+    def _submit_notebooks(self, files):
+        """Start converting all the included notebooks on the worker pool
+
+        ``new_render`` then only has to collect the finished results.
+        Notebooks with a cached result are not submitted.
+        """
+        executor = worker_pool.get(self.config["workers"])
+        for file in files:
+            if not isinstance(file, NotebookFile):
+                continue
+            if self._dirty and not file.is_modified():
+                # The page will not be rendered in this build
+                continue
+            nb_path = file.abs_src_path
+            exec_nb = self._should_execute(nb_path)
+            cache_key = self._get_cache_key(file, exec_nb)
+            if cache_key and (cache_key in self._memory or cache_key in self._store):
+                continue
+            kwargs = self._get_nb2html_kwargs(file, exec_nb)
+            render = _render_notebook
+            if self._timings_enabled():
+                render = _render_notebook_timed
+                kwargs["timing_memory"] = self.config["timing_memory"]
+            self._futures[nb_path] = executor.submit(
+                render,
+                nb_path,
+                self.config["toc_depth"],
+                executed_path=self._get_executed_path(file, exec_nb),
+                fallback_path=self._get_fallback_path(file, exec_nb),
+                shared_dirs=self.config["cache_shared_dirs"],
+                **kwargs,
+            )
+
+    def _should_execute(self, nb_path):
+        exec_nb = self.config["execute"]
+        if exec_nb == "auto":
+            exec_nb = self._should_auto_execute(nb_path)
+        for ignore_pattern in self.config["execute_ignore"]:
+            if pathlib.PurePath(nb_path).match(ignore_pattern):
+                exec_nb = False
+        return exec_nb
+
+    def _should_auto_execute(self, nb_path):
+        """Whether to execute a notebook with execute: auto
+
+        Notebooks with code cells that were never executed or older than the
+        execute_auto_marker file are executed. The result is computed once for
+        each version of the notebook and the marker.
+        """
+        marker = self.config["execute_auto_marker"]
+        marker_mtime = None
+        if marker and os.path.exists(marker):
+            marker_mtime = os.stat(marker).st_mtime_ns
+        stat = os.stat(nb_path)
+        stat_key = (stat.st_mtime_ns, stat.st_size, marker_mtime)
+        cached = self._auto_execute.get(nb_path)
+        if cached is None or cached[0] != stat_key:
+            if marker_mtime is not None and stat.st_mtime_ns < marker_mtime:
+                exec_nb = True
+            else:
+                exec_nb = _has_unexecuted_cells(nb_path)
+            cached = self._auto_execute[nb_path] = (stat_key, exec_nb)
+        return cached[1]
+
+    def _get_nb2html_kwargs(self, file, exec_nb):
+        return {
+            "execute": exec_nb,
+            "kernel_name": self.config["kernel_name"],
+            "theme": self.config["theme"],
+            "allow_errors": self.config["allow_errors"],
+            "show_input": self.config["show_input"],
+            "no_input": self.config["no_input"],
+            "no_prompt": self.config["no_prompt"],
+            "remove_tag_config": self.config["remove_tag_config"],
+            "highlight_extra_classes": self.config["highlight_extra_classes"],
+            "include_requirejs": self.config["include_requirejs"],
+            "include_clipboard_text": self.config["include_clipboard_text"],
+            "custom_mathjax_url": self.config["custom_mathjax_url"],
+            "kernel_pool": self.config["kernel_pool"],
+            "kernel_pool_reset": self.config["kernel_pool_reset"],
+            "kernel_pool_warmup": self.config["kernel_pool_warmup"],
+            "cell_cache_dir": self._get_cell_cache_dir(),
+            "cell_cache_shared_dirs": self._get_cell_cache_shared_dirs(),
+            "cell_cache_independent_tag": self.config["cell_cache_independent_tag"],
+            "cell_cache_seed": self._get_cell_cache_seed(file, exec_nb),
+            "execute_timeout": self._execute_timeout,
+            "execute_deadline": self._execute_deadline,
+            "assets": self._get_asset_urls(file),
+            "outputs": self._get_outputs(file),
+        }
+
+    def _timings_enabled(self):
+        return bool(self.config["timing_report"])
+
+    def _get_timings(self, file):
+        """Return the timings of a notebook, None if there is no timing report"""
+        if not self._timings_enabled():
+            return None
+        if file.src_path not in self._timings:
+            self._timings[file.src_path] = timing.new_timings(file.src_path)
+        return self._timings[file.src_path]
+
+    def _measure(self, file):
+        return timing.measure(
+            self._get_timings(file), memory=self.config["timing_memory"]
+        )
+
+    def _get_cell_cache_dir(self):
+        if not (self.config["cache"] and self.config["cell_cache"]):
+            return ""
+        return os.path.join(self.config["cache_dir"], cache.CELLS_DIRNAME)
+
+    def _get_cell_cache_seed(self, file, exec_nb):
+        """Return the digest of the notebook dependencies for the cell cache keys
+
+        The cached outputs of a notebook are not reused when a file it depends
+        on changes.
+        """
+        if not (self._get_cell_cache_dir() and exec_nb):
+            return ""
+        return _hash_dependencies(
+            self._get_dependencies(file, exec_nb),
+            self._manifest,
+            self.config["cache_verify"],
+        )
+
+    def _get_cell_cache_shared_dirs(self):
+        if not self._get_cell_cache_dir():
+            return []
+        return [
+            os.path.join(shared_dir, cache.CELLS_DIRNAME)
+            for shared_dir in self.config["cache_shared_dirs"]
+        ]
+
+    def _get_asset_urls(self, file):
+        """Return the URLs of the shared notebook assets relative to the page"""
+        if not self._assets:
+            return None
+        return {
+            kind: [get_relative_url(dest_path, file.url)]
+            for kind, (dest_path, _) in self._assets.items()
+        }
+
+    def _get_outputs(self, file):
+        """Return where to extract the outputs of a page and their URL
+
+        The outputs are written to the cache and copied to the site at the end
+        of the build, without cache they are written to the site directly.
+        """
+        if not (
+            self.config["extract_outputs"]
+            or self._lazy_outputs_size
+            or self.config["output_max_lines"]
+            or self._output_max_bytes
+            or self.config["widget_state"] == "external"
+            or self.config["prune_widgets"]
+        ):
+            return None
+        if self.config["cache"]:
+            outputs_dir = os.path.join(self.config["cache_dir"], cache.OUTPUTS_DIRNAME)
+        else:
+            outputs_dir = os.path.join(self._site_dir, OUTPUTS_PATH)
+        optimize = None
+        if self.config["optimize_images"]:
+            optimize = {
+                "max_width": self.config["image_max_width"],
+                "webp": self.config["image_webp"],
+            }
+        return {
+            "dir": os.path.abspath(outputs_dir),
+            "url": get_relative_url(OUTPUTS_PATH, file.url),
+            "images": self.config["extract_outputs"],
+            "optimize": optimize,
+            "lazy_size": self._lazy_outputs_size,
+            "max_lines": self.config["output_max_lines"],
+            "max_bytes": self._output_max_bytes,
+            "widget_state": self.config["widget_state"],
+            "prune_widgets": self.config["prune_widgets"],
+        }
+
+    def _get_cache_key(self, file, exec_nb):
+        """Return the cache key for a notebook or None if caching is disabled
+
+        The cache key is computed once per build and notebook.
+        """
+        if not self.config["cache"]:
+            return None
+        nb_path = file.abs_src_path
+        if nb_path not in self._cache_keys:
+            with self._measure(file):
+                self._cache_keys[nb_path] = _compute_cache_key(
+                    nb_path,
+                    self.config,
+                    exec_nb,
+                    assets=self._get_asset_urls(file),
+                    outputs=self._get_outputs(file),
+                    manifest=self._manifest,
+                    verify=self.config["cache_verify"],
+                    dependencies=self._get_dependencies(file, exec_nb),
+                )
+        return self._cache_keys[nb_path]
+
+    def _get_dependencies(self, file, exec_nb):
+        """Return the globs of the files an executed notebook depends on
+
+        These are the notebook `data_files` and the dependencies in the
+        notebook metadata.
+        """
+        if not exec_nb:
+            return []
+        nb_path = file.abs_src_path
+        if nb_path not in self._dependencies:
+            data_files = self.config["data_files"].get(file.src_path, [])
+            self._dependencies[nb_path] = [
+                os.path.abspath(data_file) for data_file in data_files
+            ] + _get_nb_dependencies(
+                nb_path, self._manifest, self.config["cache_verify"]
+            )
+        return self._dependencies[nb_path]
+
+    def _get_executed_path(self, file, exec_nb):
+        """Return the path of the cached executed notebook
+
+        None if caching is disabled or the notebook is not executed.
+        """
+        if not (self.config["cache"] and exec_nb):
+            return None
+        nb_path = file.abs_src_path
+        if nb_path not in self._executed_keys:
+            with self._measure(file):
+                self._executed_keys[nb_path] = _compute_executed_key(
+                    nb_path,
+                    self.config,
+                    exec_nb,
+                    manifest=self._manifest,
+                    verify=self.config["cache_verify"],
+                    dependencies=self._get_dependencies(file, exec_nb),
+                )
+        key = self._executed_keys[nb_path]
+        self._used_executed_keys.add(key)
+        return str(cache.get_executed_path(self.config["cache_dir"], key))
+
+    def _get_fallback_path(self, file, exec_nb):
+        """Return the path of the last executed notebook of a previous build
+
+        Its outputs are used if the execution runs out of time. None if
+        caching is disabled or the notebook was never executed.
+        """
+        if not (self.config["cache"] and exec_nb):
+            return None
+        entry = self._manifest.get(os.path.abspath(file.abs_src_path)) or {}
+        key = entry.get("executed")
+        if key is None:
+            return None
+        # Not evicted until a new execution succeeds
+        self._used_executed_keys.add(key)
+        return str(cache.get_executed_path(self.config["cache_dir"], key))
+
+    def _record_executed(self):
+        """Store the key of the executed notebooks of the build in the manifest"""
+        for nb_path, key in self._executed_keys.items():
+            path = os.path.abspath(nb_path)
+            entry = self._manifest.get(path)
+            if entry is None or entry.get("executed") == key:
+                continue
+            if cache.get_executed_path(self.config["cache_dir"], key).exists():
+                # Replace the entry, the manifest is compared with a shallow copy
+                self._manifest[path] = {**entry, "executed": key}
+
     def on_pre_page(self, page, config, files):
         if self.should_include(page.file):
             ignore_h1_titles = self.config["ignore_h1_titles"]
-
-            exec_nb = self.config["execute"]
-            kernel_name = self.config["kernel_name"]
-            allow_errors = self.config["allow_errors"]
-            show_input = self.config["show_input"]
-            no_input = self.config["no_input"]
-            no_prompt = self.config["no_prompt"]
-            remove_tag_config = self.config["remove_tag_config"]
-            highlight_extra_classes = self.config["highlight_extra_classes"]
-            include_requirejs = self.config["include_requirejs"]
             toc_depth = self.config["toc_depth"]
-            custom_mathjax_url = self.config["custom_mathjax_url"]
 
-            if self.config["execute_ignore"] and len(self.config["execute_ignore"]) > 0:
-                for ignore_pattern in self.config["execute_ignore"]:
-                    ignore_this = pathlib.PurePath(page.file.abs_src_path).match(
-                        ignore_pattern
-                    )
-                    if ignore_this:
-                        exec_nb = False
+            nb_path = page.file.abs_src_path
+            exec_nb = self._should_execute(nb_path)
+            nb2html_kwargs = self._get_nb2html_kwargs(page.file, exec_nb)
+            executed_path = self._get_executed_path(page.file, exec_nb)
+            fallback_path = self._get_fallback_path(page.file, exec_nb)
+            shared_dirs = self.config["cache_shared_dirs"]
 
-            theme = self.config["theme"]
-            cache_enabled = self.config["cache"]
-            cache_dir = self.config["cache_dir"]
+            cache_key = self._get_cache_key(page.file, exec_nb)
+            if cache_key:
+                self._used_cache_keys[cache_key] = page.file.src_path
+            store = self._store
+            memory = self._memory
+            cache_hits = self._cache_hits
+            outputs = nb2html_kwargs["outputs"]
+            used_outputs = self._used_outputs
+            stats = self._cache_stats
 
-            if cache_enabled:
-                cache_key = _compute_cache_key(
-                    page.file.abs_src_path, self.config, exec_nb
-                )
-                cache_path = _get_cache_path(cache_dir, cache_key)
-                self._used_cache_paths.add(cache_path)
-            else:
-                cache_path = None
+            future = self._futures.pop(nb_path, None)
+            timings = self._get_timings(page.file)
+            memory_timing = self.config["timing_memory"]
 
             def new_render(self, config, files):
-                if cache_path and cache_path.exists():
-                    logger.info("Cache hit: %s", page.file.abs_src_path)
-                    cached = json.loads(cache_path.read_text(encoding="utf-8"))
+                with timing.measure(timings, memory=memory_timing):
+                    render(self)
+
+            def render(self):
+                cached = None
+                if cache_key:
+                    with timing.stage("cache"):
+                        cached = memory.get(cache_key)
+                        if cached is None:
+                            cached = store.get(cache_key)
+                            if cached is not None:
+                                memory.put(cache_key, cached)
+                        if cached is not None:
+                            cache_hits.add(cache_key)
+                if cached is not None and not _has_outputs(cached, outputs):
+                    logger.info("Cache hit with missing outputs: %s", nb_path)
+                    cached = None
+                if cached is not None:
+                    logger.info("Cache hit: %s", nb_path)
+                    stats["hits"] += 1
+                    used_outputs.update(cached.get("outputs", []))
                     self.content = cached["content"]
                     self.toc = get_toc(cached["toc_tokens"])
                     if cached.get("title") is not None and not ignore_h1_titles:
                         self.title = cached["title"]
+                    _set_page_timings(timings, "hit", cached)
                     return
 
-                body = convert.nb2html(
-                    page.file.abs_src_path,
-                    execute=exec_nb,
-                    kernel_name=kernel_name,
-                    theme=theme,
-                    allow_errors=allow_errors,
-                    show_input=show_input,
-                    no_input=no_input,
-                    no_prompt=no_prompt,
-                    remove_tag_config=remove_tag_config,
-                    highlight_extra_classes=highlight_extra_classes,
-                    include_requirejs=include_requirejs,
-                    custom_mathjax_url=custom_mathjax_url,
-                )
+                if future is not None:
+                    with timing.stage("wait"):
+                        result = future.result()
+                    if timings is not None:
+                        result, worker_timings = result
+                        timing.merge(timings, worker_timings)
+                    body, toc_tokens, title, timed_out = result
+                else:
+                    body, toc_tokens, title, timed_out = _render_notebook(
+                        nb_path,
+                        toc_depth,
+                        executed_path=executed_path,
+                        fallback_path=fallback_path,
+                        shared_dirs=shared_dirs,
+                        **nb2html_kwargs,
+                    )
                 self.content = body
-                toc_tokens, title = _get_nb_toc_tokens(
-                    page.file.abs_src_path, toc_depth
-                )
                 self.toc = get_toc(toc_tokens)
                 if title is not None and not ignore_h1_titles:
                     self.title = title
+                output_names = _find_outputs(body) if outputs else []
+                used_outputs.update(output_names)
+                entry = {
+                    "content": body,
+                    "toc_tokens": toc_tokens,
+                    "title": title,
+                    "outputs": output_names,
+                }
+                _set_page_timings(timings, "miss" if cache_key else None, entry)
 
-                if cache_path:
-                    logger.info("Cache miss, writing: %s", page.file.abs_src_path)
-                    cache_path.parent.mkdir(parents=True, exist_ok=True)
-                    cache_path.write_text(
-                        json.dumps(
-                            {
-                                "content": body,
-                                "toc_tokens": toc_tokens,
-                                "title": title,
-                            }
-                        ),
-                        encoding="utf-8",
-                    )
+                if cache_key and timed_out:
+                    # Executed again by the next build
+                    logger.info("Cache miss, not writing: %s", nb_path)
+                    stats["misses"] += 1
+                elif cache_key:
+                    logger.info("Cache miss, writing: %s", nb_path)
+                    stats["misses"] += 1
+                    with timing.stage("cache"):
+                        store.put(cache_key, entry)
+                        memory.put(cache_key, entry)
 
             # replace render with new_render for this object only
             page.render = new_render.__get__(page, Page)
@@ -231,15 +683,266 @@ class Plugin(mkdocs.plugins.BasePlugin):
             logger.info("Copied data files: %s to %s", data_files, data_target_dir)
 
     def on_post_build(self, config):
+        # Pages that were never rendered (e.g. excluded from nav)
+        for future in self._futures.values():
+            future.cancel()
+        self._futures = {}
+
+        if self._assets:
+            for dest_path, content in self._assets.values():
+                write_file(
+                    content.encode("utf-8"), os.path.join(config["site_dir"], dest_path)
+                )
+
+        if self._timings_enabled():
+            self._write_timing_report(config["site_dir"])
+
         if not self.config["cache"]:
             return
-        cache_dir = pathlib.Path(self.config["cache_dir"])
-        if not cache_dir.is_dir():
-            return
-        for cache_file in cache_dir.glob("*.json"):
-            if cache_file not in self._used_cache_paths:
-                cache_file.unlink()
-                logger.info("Evicted stale cache: %s", cache_file)
+        if self._used_outputs:
+            self._copy_outputs(config["site_dir"])
+        self._record_executed()
+        if self._manifest != self._saved_manifest:
+            _save_manifest(self.config["cache_dir"], self._manifest)
+        # Record the use of the entries read in this build in one batch
+        self._store.touch(self._cache_hits)
+        if self._dirty:
+            self._use_unmodified_pages()
+        builds = cache.record_build(
+            self.config["cache_dir"],
+            {**self._cache_stats, "pages": self._used_cache_keys},
+        )
+        policy = {
+            "keep_builds": self.config["cache_keep_builds"],
+            "max_age": self._cache_max_age,
+            "builds": builds,
+        }
+        cache.evict(
+            self._store, self._used_cache_keys, max_size=self._cache_max_size, **policy
+        )
+        cache.evict_executed(
+            self.config["cache_dir"], self._used_executed_keys, **policy
+        )
+        cache.evict_cells(self.config["cache_dir"], **policy)
+        # Without a policy the outputs of the pages skipped by a dirty build
+        # are unknown, they are evicted by the next full build
+        if not self._dirty or policy["keep_builds"] or policy["max_age"]:
+            cache.evict_outputs(self.config["cache_dir"], self._used_outputs, **policy)
+        self._store.close()
+
+    def _write_timing_report(self, site_dir):
+        """Write the timings of the notebooks of the build as JSON"""
+        if self.config["cache"]:
+            outputs_dir = os.path.join(self.config["cache_dir"], cache.OUTPUTS_DIRNAME)
+        else:
+            outputs_dir = os.path.join(site_dir, OUTPUTS_PATH)
+        notebooks = sorted(self._timings.values(), key=lambda t: -t["total"])
+        for timings in notebooks:
+            timings["outputs_bytes"] = 0
+            for name in timings.pop("outputs", []):
+                path = os.path.join(outputs_dir, name)
+                if os.path.exists(path):
+                    timings["outputs_bytes"] += os.path.getsize(path)
+        report = {
+            "build": {
+                "start": self._cache_stats["start"],
+                "duration": time.time() - self._cache_stats["start"],
+                "hits": self._cache_stats["hits"],
+                "misses": self._cache_stats["misses"],
+            },
+            "notebooks": notebooks,
+        }
+        path = self.config["timing_report"]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        timing.log_slowest(notebooks, self.config["timing_top"])
+        if self.config["timing_memory"] and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _copy_outputs(self, site_dir):
+        """Copy the extracted outputs of the pages from the cache to the site"""
+        from shutil import copyfile
+
+        outputs_dir = os.path.join(self.config["cache_dir"], cache.OUTPUTS_DIRNAME)
+        for name in self._used_outputs:
+            dest = os.path.join(site_dir, OUTPUTS_PATH, name)
+            if not os.path.exists(dest):
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                copyfile(os.path.join(outputs_dir, name), dest)
+
+    def _use_unmodified_pages(self):
+        """Mark the cache entries of the pages skipped by a dirty build as used
+
+        This way they are not evicted and count as used for keep_builds.
+        """
+        keys = {}
+        for file in self._notebook_files:
+            if file.is_modified():
+                continue
+            exec_nb = self._should_execute(file.abs_src_path)
+            self._get_executed_path(file, exec_nb)
+            cache_key = self._get_cache_key(file, exec_nb)
+            if cache_key not in self._used_cache_keys:
+                keys[cache_key] = file.src_path
+        self._store.touch(keys)
+        self._used_cache_keys.update(keys)
+
+
+def _read_front_matter(path):
+    """Return the YAML front matter of a markdown file as a dict.
+
+    Only the front matter is read, not the rest of the file.
+    """
+    lines = []
+    with open(path, encoding="utf-8") as f:
+        if f.readline().rstrip() != "---":
+            return {}
+        for line in f:
+            if line.rstrip() == "---":
+                return yaml.safe_load("".join(lines)) or {}
+            lines.append(line)
+    return {}
+
+
+def _has_unexecuted_cells(nb_path):
+    """Whether a notebook has code cells without outputs or execution count
+
+    These are the notebooks stored without outputs (and the .py and .md
+    notebooks), empty code cells are ignored.
+    """
+    nb = convert.read_notebook(nb_path)
+    return any(
+        cell.cell_type == "code"
+        and cell.source.strip()
+        and cell.execution_count is None
+        and not cell.outputs
+        for cell in nb.cells
+    )
+
+
+def _render_notebook_timed(nb_path, *args, **kwargs):
+    """Run `_render_notebook` on a worker, returns its result and timings"""
+    timings = timing.new_timings(nb_path)
+    with timing.measure(timings, memory=kwargs.pop("timing_memory", False)):
+        result = _render_notebook(nb_path, *args, **kwargs)
+    return result, timings
+
+
+def _render_notebook(
+    nb_path,
+    toc_depth,
+    executed_path=None,
+    fallback_path=None,
+    shared_dirs=(),
+    **nb2html_kwargs,
+):
+    """Convert a notebook and extract its TOC.
+
+    This is a module level function so it can run on the worker pool.
+    With executed_path the notebook is executed only if there is no executed
+    notebook cached at that path (or in the shared_dirs cache directories).
+    If the execution runs out of time the notebook is rendered with the outputs
+    of the executed notebook at fallback_path or its own outputs.
+    Returns (body, toc_tokens, title, timed_out).
+    """
+    nb = convert.read_notebook(nb_path)
+    timed_out = False
+    try:
+        if executed_path:
+            executed_nb = _get_executed_notebook(
+                nb_path, nb, executed_path, nb2html_kwargs, shared_dirs
+            )
+            body = convert.nb2html(
+                nb_path, nb=executed_nb, **{**nb2html_kwargs, "execute": False}
+            )
+        else:
+            body = convert.nb2html(nb_path, nb=nb, **nb2html_kwargs)
+    except CellTimeoutError:
+        timed_out = True
+        fallback_nb = cache.load_executed(fallback_path) if fallback_path else None
+        logger.warning(
+            "Execution ran out of time, using the %s: %s",
+            "last executed outputs" if fallback_nb else "outputs of the notebook",
+            nb_path,
+        )
+        nb = copy.deepcopy(nb)
+        if fallback_nb is not None:
+            _restore_outputs(nb, fallback_nb)
+        body = convert.nb2html(nb_path, nb=nb, **{**nb2html_kwargs, "execute": False})
+    toc_tokens, title = _get_toc_tokens(convert.nb_markdown(nb), toc_depth)
+    return body, toc_tokens, title, timed_out
+
+
+def _get_executed_notebook(nb_path, nb, executed_path, nb2html_kwargs, shared_dirs=()):
+    """Return the cached executed notebook or execute nb and cache it."""
+    with timing.stage("cache"):
+        executed_nb = cache.load_executed(executed_path, shared_dirs)
+    if executed_nb is not None:
+        logger.info("Executed notebook cache hit: %s", nb_path)
+        return executed_nb
+    executed_nb = convert.execute_notebook(
+        nb_path,
+        nb=copy.deepcopy(nb),
+        kernel_name=nb2html_kwargs["kernel_name"],
+        allow_errors=nb2html_kwargs["allow_errors"],
+        remove_tag_config=nb2html_kwargs["remove_tag_config"],
+        kernel_pool=nb2html_kwargs["kernel_pool"],
+        kernel_pool_reset=nb2html_kwargs["kernel_pool_reset"],
+        kernel_pool_warmup=nb2html_kwargs["kernel_pool_warmup"],
+        cell_cache_dir=nb2html_kwargs["cell_cache_dir"],
+        cell_cache_shared_dirs=nb2html_kwargs["cell_cache_shared_dirs"],
+        cell_cache_independent_tag=nb2html_kwargs["cell_cache_independent_tag"],
+        cell_cache_seed=nb2html_kwargs["cell_cache_seed"],
+        execute_timeout=nb2html_kwargs["execute_timeout"],
+        execute_deadline=nb2html_kwargs["execute_deadline"],
+    )
+    with timing.stage("cache"):
+        cache.save_executed(executed_path, executed_nb)
+    return executed_nb
+
+
+def _restore_outputs(nb, executed_nb):
+    """Copy the outputs of the code cells of executed_nb to the same cells of nb
+
+    The cells are matched by their source, the cells edited since then keep
+    their own outputs.
+    """
+    executed = {
+        cell.source: cell for cell in executed_nb.cells if cell.cell_type == "code"
+    }
+    for cell in nb.cells:
+        if cell.cell_type == "code" and cell.source in executed:
+            cell.outputs = executed[cell.source].outputs
+            cell.execution_count = executed[cell.source].execution_count
+    if "widgets" in executed_nb.metadata:
+        nb.metadata["widgets"] = executed_nb.metadata["widgets"]
+
+
+def _set_page_timings(timings, cache_status, entry):
+    """Add the cache status and the sizes of a rendered page to its timings"""
+    if timings is None:
+        return
+    timings["cache"] = cache_status
+    timings["html_bytes"] = len(entry["content"].encode("utf-8"))
+    timings["outputs"] = entry.get("outputs", [])
+
+
+def _find_outputs(body):
+    """Return the names of the extracted outputs linked from a page."""
+    pattern = re.escape(OUTPUTS_PATH) + r"/([0-9a-f]{32}\.\w+)"
+    return sorted(set(re.findall(pattern, body)))
+
+
+def _has_outputs(entry, outputs):
+    """Whether the extracted outputs of a cache entry exist."""
+    if not outputs:
+        return True
+    return all(
+        os.path.exists(os.path.join(outputs["dir"], name))
+        for name in entry.get("outputs", [])
+    )
 
 
 def _get_markdown_toc(markdown_source, toc_depth):
@@ -251,11 +954,17 @@ def _get_markdown_toc(markdown_source, toc_depth):
 def _get_nb_toc_tokens(fpath, toc_depth):
     """Returns raw TOC tokens and title for the Notebook.
 
-    Converts to Markdown first, then extracts TOC tokens.
+    Uses the Markdown of the markdown cells to extract the TOC tokens.
     Returns (toc_tokens, title) where toc_tokens is a list of dicts.
     """
-    body = convert.nb2md(fpath)
-    md_toc_tokens = _get_markdown_toc(body, toc_depth)
+    nb = convert.read_notebook(fpath)
+    return _get_toc_tokens(convert.nb_markdown(nb), toc_depth)
+
+
+@timing.timed("toc")
+def _get_toc_tokens(markdown_source, toc_depth):
+    """Returns raw TOC tokens and title for the Markdown of a Notebook."""
+    md_toc_tokens = _get_markdown_toc(markdown_source, toc_depth)
     title = None
     for token in md_toc_tokens:
         if token["level"] == 1 and title is None:
@@ -265,40 +974,176 @@ def _get_nb_toc_tokens(fpath, toc_depth):
 
 def get_nb_toc(fpath, toc_depth):
     """Returns a TOC for the Notebook
-    It does that by converting first to MD
+    It does that by using the Markdown of the markdown cells
     """
     md_toc_tokens, title = _get_nb_toc_tokens(fpath, toc_depth)
     toc = get_toc(md_toc_tokens)
     return toc, title
 
 
-def _compute_cache_key(nb_path, config, exec_nb):
+def _get_site_assets(theme):
+    """Return the shared notebook CSS and JS with their content-hashed paths.
+
+    Returns a dict of {"css": (dest_path, content), "js": (dest_path, content)}.
+    """
+    assets = {}
+    for kind, content in convert.get_html_assets(theme).items():
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+        dest_path = f"assets/mkdocs-jupyter/notebook.{digest}.{kind}"
+        assets[kind] = (dest_path, content)
+    return assets
+
+
+@timing.timed("hash")
+def _compute_cache_key(
+    nb_path,
+    config,
+    exec_nb,
+    assets=None,
+    outputs=None,
+    manifest=None,
+    verify=False,
+    dependencies=(),
+):
     """Compute a SHA-256 hash from notebook content and relevant config options.
 
     Uses the resolved exec_nb value (after execute_ignore processing) rather
     than config["execute"], so that notebooks in execute_ignore get a distinct
-    cache key.
+    cache key. The URLs of the shared assets and the extracted outputs are part
+    of the key because they are relative to the page, so are the options of the
+    extracted outputs (except their directory). See `_hash_file` for manifest
+    and verify and `_compute_executed_key` for dependencies.
     """
     hasher = hashlib.sha256()
-    hasher.update(pathlib.Path(nb_path).read_bytes())
-    hasher.update(f"execute={exec_nb}".encode())
+    executed_key = _compute_executed_key(
+        nb_path, config, exec_nb, manifest, verify, dependencies
+    )
+    hasher.update(executed_key.encode())
     for key in (
-        "kernel_name",
         "theme",
-        "allow_errors",
         "show_input",
         "no_input",
         "no_prompt",
         "remove_tag_config",
         "highlight_extra_classes",
         "include_requirejs",
+        "include_clipboard_text",
         "custom_mathjax_url",
         "toc_depth",
     ):
         hasher.update(f"{key}={repr(config[key])}".encode())
+    if assets:
+        hasher.update(f"assets={repr(assets)}".encode())
+    if outputs:
+        options = sorted((k, v) for k, v in outputs.items() if k != "dir")
+        hasher.update(f"outputs={repr(options)}".encode())
+    return hasher.hexdigest()
+
+
+@timing.timed("hash")
+def _compute_executed_key(
+    nb_path, config, exec_nb, manifest=None, verify=False, dependencies=()
+):
+    """Compute a SHA-256 hash from notebook content and the execution options.
+
+    This is the key of the executed notebook, `_compute_cache_key` adds the
+    presentation options to it. remove_tag_config is part of it because the
+    removed cells are not executed. When the notebook is executed the content
+    of the files matching the dependencies globs is part of the key.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(_hash_file(nb_path, manifest, verify).encode())
+    hasher.update(f"execute={exec_nb}".encode())
+    for key in ("kernel_name", "allow_errors", "remove_tag_config"):
+        hasher.update(f"{key}={repr(config[key])}".encode())
+    if exec_nb:
+        hasher.update(_hash_dependencies(dependencies, manifest, verify).encode())
+    return hasher.hexdigest()
+
+
+def _hash_dependencies(dependencies, manifest=None, verify=False):
+    """Return a SHA-256 hex digest of the globs and the files matching them."""
+    hasher = hashlib.sha256()
+    for pattern in sorted(dependencies):
+        hasher.update(f"dependency={pattern}".encode())
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if os.path.isfile(path):
+                digest = _hash_file(path, manifest, verify)
+                hasher.update(f"{path}={digest}".encode())
     return hasher.hexdigest()
 
 
-def _get_cache_path(cache_dir, cache_key):
-    """Return the Path for a given cache key."""
-    return pathlib.Path(cache_dir) / f"{cache_key}.json"
+@timing.timed("hash")
+def _get_nb_dependencies(nb_path, manifest=None, verify=False):
+    """Return the dependencies globs declared in the notebook metadata.
+
+    The globs are relative to the notebook and returned as absolute paths:
+
+        "metadata": {"mkdocs_jupyter": {"dependencies": ["data/*.csv"]}}
+
+    They are stored in the manifest with the digest of the notebook so the
+    notebook is only read again when it changes.
+    """
+    _hash_file(nb_path, manifest, verify)
+    entry = manifest.get(os.path.abspath(nb_path)) if manifest is not None else None
+    if entry is not None and "dependencies" in entry:
+        return entry["dependencies"]
+
+    try:
+        nb = convert.read_notebook(nb_path)
+        metadata = nb.metadata.get("mkdocs_jupyter", {})
+        patterns = list(metadata.get("dependencies", []))
+    except Exception:
+        logger.warning("Could not read the dependencies of: %s", nb_path)
+        patterns = []
+    nb_dir = os.path.dirname(os.path.abspath(nb_path))
+    dependencies = [os.path.join(nb_dir, pattern) for pattern in patterns]
+    if entry is not None:
+        # Replace the entry, the manifest is compared with a shallow copy
+        manifest[os.path.abspath(nb_path)] = {**entry, "dependencies": dependencies}
+    return dependencies
+
+
+def _hash_file(path, manifest=None, verify=False):
+    """Return the SHA-256 hex digest of a file's content.
+
+    When a manifest dict is given, the digest of a file whose
+    (mtime_ns, size, inode) did not change is taken from it instead of
+    reading the file. verify=True always reads the file.
+    The manifest is updated with the new digest.
+    """
+    stat = os.stat(path)
+    stat_key = [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+    path = os.path.abspath(path)
+    entry = manifest.get(path) if manifest is not None else None
+    if entry and entry["stat"] == stat_key and not verify:
+        return entry["sha256"]
+
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    if manifest is not None:
+        manifest[path] = {"stat": stat_key, "sha256": digest}
+        # The last executed notebook is kept when the file changes
+        if entry and "executed" in entry:
+            manifest[path]["executed"] = entry["executed"]
+    return digest
+
+
+def _load_manifest(cache_dir):
+    """Load the manifest of file digests from the cache directory."""
+    manifest_path = pathlib.Path(cache_dir) / MANIFEST_FILENAME
+    try:
+        return json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(cache_dir, manifest):
+    """Save the manifest, dropping the files that no longer exist."""
+    manifest = {path: entry for path, entry in manifest.items() if os.path.exists(path)}
+    manifest_path = pathlib.Path(cache_dir) / MANIFEST_FILENAME
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
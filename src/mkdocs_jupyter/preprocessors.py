@@ -1,7 +1,27 @@
+import base64
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import re
+import time
 from copy import deepcopy
 
-from nbconvert.preprocessors import Preprocessor
-from traitlets import Integer
+import nbformat
+from nbclient import NotebookClient
+from nbclient.exceptions import CellTimeoutError
+from nbconvert.preprocessors import ExecutePreprocessor, Preprocessor
+from traitlets import Bool, Enum, Integer, List, Unicode
+
+from mkdocs_jupyter import cache, images, timing
+from mkdocs_jupyter.kernels import kernel_pool
+
+# ANSI escape sequences (colors) are removed from the full text outputs
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+WIDGET_STATE_MIMETYPE = "application/vnd.jupyter.widget-state+json"
+WIDGET_VIEW_MIMETYPE = "application/vnd.jupyter.widget-view+json"
 
 
 class SliceIndex(Integer):
@@ -27,3 +47,501 @@ class SubCell(Preprocessor):
         nbc = deepcopy(nb)
         nbc.cells = nbc.cells[self.start : self.end]
         return nbc, resources
+
+
+class ExtractOutputs(Preprocessor):
+    """Write the image outputs to files named after their content
+
+    Works like the nbconvert ExtractOutputPreprocessor but the files are
+    written by the preprocessor to a shared directory, so identical images in
+    different notebooks are stored once. The outputs are linked with
+    ``output.metadata.filenames`` (used by the templates).
+
+    Only runs when ``resources["mkdocs"]["outputs"]`` has the directory to
+    write the files to (``dir``) and its URL relative to the page (``url``).
+    With ``optimize`` (``max_width`` and ``webp``) the images are optimized
+    with `images.optimize_image`, the file names are the hash of the original
+    image and the options so an image is only optimized once.
+
+    HTML and JavaScript outputs larger than ``lazy_size`` bytes are written to
+    files too, the template renders a placeholder that ``lazy-output.js``
+    replaces with the output when it is scrolled into view. Images are only
+    extracted if ``images`` is true (the default).
+    """
+
+    # Mime type and file extension of the extracted outputs
+    mimetypes = {"image/png": ".png", "image/jpeg": ".jpg", "image/svg+xml": ".svg"}
+    # Mime type and file extension of the outputs that can be loaded lazily
+    lazy_mimetypes = {"text/html": ".html", "application/javascript": ".js"}
+
+    def preprocess(self, nb, resources):
+        outputs = resources.get("mkdocs", {}).get("outputs")
+        if not outputs:
+            return nb, resources
+        for cell in nb.cells:
+            for output in cell.get("outputs", []):
+                if output.output_type not in ("display_data", "execute_result"):
+                    continue
+                if outputs.get("images", True):
+                    self._extract(
+                        output,
+                        outputs["dir"],
+                        outputs["url"],
+                        outputs.get("optimize"),
+                    )
+                if outputs.get("lazy_size"):
+                    self._extract_lazy(
+                        output, outputs["dir"], outputs["url"], outputs["lazy_size"]
+                    )
+        return nb, resources
+
+    def _extract_lazy(self, output, output_dir, url, lazy_size):
+        for mimetype, extension in self.lazy_mimetypes.items():
+            if mimetype not in output.data:
+                continue
+            data = output.data[mimetype]
+            if isinstance(data, list):
+                data = "".join(data)
+            data = data.encode("utf-8")
+            if len(data) <= lazy_size:
+                continue
+            filename = hashlib.sha256(data).hexdigest()[:32] + extension
+            _write_once(pathlib.Path(output_dir) / filename, data)
+            filenames = output.setdefault("metadata", {}).setdefault("filenames", {})
+            filenames[mimetype] = f"{url}/{filename}"
+
+    def _extract(self, output, output_dir, url, optimize=None):
+        for mimetype, extension in self.mimetypes.items():
+            if mimetype not in output.data:
+                continue
+            data = output.data[mimetype]
+            if mimetype == "image/svg+xml":
+                data = data.encode("utf-8")
+            else:
+                data = base64.b64decode(data)
+            hasher = hashlib.sha256(data)
+            if optimize:
+                hasher.update(repr(sorted(optimize.items())).encode())
+            path = pathlib.Path(output_dir) / (hasher.hexdigest()[:32] + extension)
+            if optimize:
+                optimized = path.with_suffix(
+                    images.get_extension(mimetype, optimize["webp"])
+                )
+                # Images that can't be optimized are written with their own
+                # extension, don't try to optimize them again
+                if optimized.exists() or not path.exists():
+                    path = optimized
+            if not path.exists():
+                if optimize:
+                    data, extension = images.optimize_image(data, mimetype, **optimize)
+                    path = path.with_suffix(extension)
+                _write_once(path, data)
+            filename = path.name
+            filenames = output.setdefault("metadata", {}).setdefault("filenames", {})
+            filenames[mimetype] = f"{url}/{filename}"
+
+
+class TruncateOutputs(Preprocessor):
+    """Keep the head and tail of the long stream and error outputs
+
+    Only runs when ``resources["mkdocs"]["outputs"]`` has a limit of lines
+    (``max_lines``) or bytes (``max_bytes``) per output. The full output is
+    written to a text file in the outputs directory (``dir``) and linked with
+    ``output.metadata.filenames["text/plain"]`` (used by the template).
+    """
+
+    def preprocess(self, nb, resources):
+        outputs = resources.get("mkdocs", {}).get("outputs")
+        if not outputs or not (outputs.get("max_lines") or outputs.get("max_bytes")):
+            return nb, resources
+        for cell in nb.cells:
+            for output in cell.get("outputs", []):
+                if output.output_type == "stream":
+                    text = output.text
+                elif output.output_type == "error":
+                    text = "\n".join(output.traceback)
+                else:
+                    continue
+                truncated = _truncate(
+                    text, outputs.get("max_lines", 0), outputs.get("max_bytes", 0)
+                )
+                if truncated is None:
+                    continue
+                if output.output_type == "stream":
+                    output.text = truncated
+                else:
+                    output.traceback = truncated.split("\n")
+                data = ANSI_ESCAPE.sub("", text).encode("utf-8")
+                filename = hashlib.sha256(data).hexdigest()[:32] + ".txt"
+                _write_once(pathlib.Path(outputs["dir"]) / filename, data)
+                filenames = output.setdefault("metadata", {}).setdefault(
+                    "filenames", {}
+                )
+                filenames["text/plain"] = f"{outputs['url']}/{filename}"
+        return nb, resources
+
+
+class WidgetState(Preprocessor):
+    """Prune the widget state and write it to a file
+
+    Only runs when ``resources["mkdocs"]["outputs"]`` has ``prune_widgets``,
+    to keep only the state of the displayed widgets and the models they
+    reference, or ``widget_state`` set to ``external``. Then the state is
+    written to a JSON file in the outputs directory (``dir``) and its URL is
+    set as ``resources["mkdocs"]["widget_state_url"]`` instead of being
+    embedded in the page, ``widget-state.js`` loads it when a widget is
+    scrolled into view.
+    """
+
+    def preprocess(self, nb, resources):
+        outputs = resources.get("mkdocs", {}).get("outputs")
+        widgets = nb.metadata.get("widgets", {})
+        if not outputs or WIDGET_STATE_MIMETYPE not in widgets:
+            return nb, resources
+        state = widgets[WIDGET_STATE_MIMETYPE]
+        if outputs.get("prune_widgets"):
+            state = dict(state, state=_prune_widget_state(nb, state["state"]))
+            widgets[WIDGET_STATE_MIMETYPE] = state
+        if outputs.get("widget_state") == "external":
+            data = json.dumps(state, separators=(",", ":")).encode("utf-8")
+            filename = hashlib.sha256(data).hexdigest()[:32] + ".json"
+            _write_once(pathlib.Path(outputs["dir"]) / filename, data)
+            del nb.metadata["widgets"]
+            resources["mkdocs"]["widget_state_url"] = f"{outputs['url']}/{filename}"
+        return nb, resources
+
+
+class Execute(ExecutePreprocessor):
+    """Execute the notebook
+
+    Compared to the nbconvert ExecutePreprocessor this can borrow a warm
+    kernel from the kernel pool and reuse the outputs of the unchanged code
+    cells from a previous execution.
+
+    The execution of a notebook stops with a ``CellTimeoutError`` after
+    ``notebook_timeout`` seconds (``execute_timeout`` in the ``mkdocs_jupyter``
+    notebook metadata overrides it) or at the end of the build budget, the
+    ``resources["mkdocs"]["execute_deadline"]`` timestamp.
+    """
+
+    kernel_pool = Bool(False, config=True, help="Use a kernel from the pool")
+    reset = Enum(
+        ["reset", "restart"],
+        default_value="reset",
+        config=True,
+        help="How to clean a pooled kernel before it is reused",
+    )
+    warmup = Unicode("", config=True, help="Code to run on every pooled kernel")
+    cell_cache_dir = Unicode(
+        "", config=True, help="Directory of the cell outputs cache, empty to disable"
+    )
+    cell_cache_shared_dirs = List(
+        Unicode(), config=True, help="Read-only cell cache directories"
+    )
+    independent_tag = Unicode(
+        "cache-independent",
+        config=True,
+        help="Tag of the cells whose outputs depend only on their own source",
+    )
+    notebook_timeout = Integer(
+        0, config=True, help="Seconds to execute a notebook, 0 for no limit"
+    )
+
+    def preprocess(self, nb, resources=None, km=None):
+        self._deadline = self._get_deadline(nb, resources)
+        if not self.cell_cache_dir:
+            return self._execute(nb, resources, km, self.preprocess_cell)
+
+        cache = CellCache(self.cell_cache_dir, self.cell_cache_shared_dirs)
+        kernel_name = self._get_kernel_name(nb)
+        keys = cache.keys(
+            nb, kernel_name, self.independent_tag, self._get_cell_cache_seed(resources)
+        )
+        entries = {index: cache.load(key) for index, key in keys.items()}
+
+        # Cells that depend on the kernel state are replayed (outputs discarded)
+        # until the first one that changed, from there on they are executed
+        dependent = [i for i in keys if not self._is_independent(nb.cells[i])]
+        misses = [i for i in dependent if entries[i] is None]
+        first_miss = misses[0] if misses else len(nb.cells)
+
+        if all(entry is not None for entry in entries.values()):
+            self.log.info("All code cells found in the cell cache")
+            for index, entry in entries.items():
+                _restore_cell(nb.cells[index], entry)
+            if dependent and "widgets" in entries[dependent[-1]]:
+                nb.metadata["widgets"] = entries[dependent[-1]]["widgets"]
+            return nb, resources
+
+        def run_cell(cell, resources, index):
+            entry = entries.get(index)
+            independent = self._is_independent(cell)
+            if entry is not None and (independent or index < first_miss):
+                if not independent and misses:
+                    # Bring the kernel to the state the changed cells expect
+                    self.execute_cell(deepcopy(cell), index, store_history=True)
+                _restore_cell(cell, entry)
+                return cell, self.resources
+            cell, resources = self.preprocess_cell(cell, resources, index)
+            if index in keys:
+                cache.save(keys[index], cell)
+            return cell, resources
+
+        nb, resources = self._execute(nb, resources, km, run_cell)
+        if dependent and "widgets" in nb.metadata:
+            cache.save(keys[dependent[-1]], nb.cells[dependent[-1]], nb.metadata)
+        return nb, resources
+
+    def _execute(self, nb, resources, km, run_cell):
+        """Same as ExecutePreprocessor.preprocess running each cell with run_cell"""
+        if self._deadline is not None and self._deadline <= time.time():
+            raise CellTimeoutError("The execution time budget is exhausted")
+        if km is None and self.kernel_pool:
+            kernel_name = self._get_kernel_name(nb)
+            cwd = (resources or {}).get("metadata", {}).get("path") or None
+            with timing.stage("kernel"):
+                km = kernel_pool.acquire(
+                    kernel_name, cwd=cwd, reset=self.reset, warmup=self.warmup
+                )
+            discard = False
+            try:
+                return self._execute(nb, resources, km, run_cell)
+            except CellTimeoutError:
+                # The kernel may still be running the cell
+                discard = True
+                raise
+            finally:
+                # We don't own the kernel so the client is not cleaned up for us
+                if self.kc is not None:
+                    self.kc.stop_channels()
+                    self.kc = None
+                kernel_pool.release(
+                    kernel_name, km, warmup=self.warmup, discard=discard
+                )
+
+        NotebookClient.__init__(self, nb, km)
+        self.timeout_func = self._get_cell_timeout
+        self.reset_execution_trackers()
+        self._check_assign_resources(resources)
+
+        with contextlib.ExitStack() as stack:
+            with timing.stage("kernel"):
+                stack.enter_context(self.setup_kernel())
+                assert self.kc
+                info_msg = self.wait_for_reply(self.kc.kernel_info())
+            assert info_msg
+            self.nb.metadata["language_info"] = info_msg["content"]["language_info"]
+            with timing.stage("execute"):
+                for index, cell in enumerate(self.nb.cells):
+                    run_cell(cell, resources, index)
+        self.set_widgets_metadata()
+
+        return self.nb, self.resources
+
+    def _get_cell_cache_seed(self, resources):
+        """Return what the outputs depend on besides the code: the options, the
+        working directory and ``resources["mkdocs"]["cell_cache_seed"]`` (the
+        digest of the notebook dependencies)"""
+        resources = resources or {}
+        path = resources.get("metadata", {}).get("path") or ""
+        seed = resources.get("mkdocs", {}).get("cell_cache_seed", "")
+        return (
+            f"allow_errors={self.allow_errors}\n"
+            f"path={os.path.abspath(path)}\n"
+            f"seed={seed}"
+        )
+
+    def _get_deadline(self, nb, resources):
+        """Return the timestamp when the execution must stop, None for no limit"""
+        metadata = nb.metadata.get("mkdocs_jupyter", {})
+        # Same syntax as the execute_timeout option, e.g. 600 or "10m"
+        timeout = cache.parse_age(
+            metadata.get("execute_timeout", self.notebook_timeout)
+        )
+        deadlines = []
+        if timeout:
+            deadlines.append(time.time() + timeout)
+        build_deadline = (resources or {}).get("mkdocs", {}).get("execute_deadline")
+        if build_deadline:
+            deadlines.append(build_deadline)
+        return min(deadlines, default=None)
+
+    def _get_cell_timeout(self, cell):
+        """The cell timeout of nbclient shortened to the time left"""
+        if self._deadline is None:
+            return self.timeout
+        # nbclient reads a timeout of 0 as no timeout
+        remaining = max(self._deadline - time.time(), 0.1)
+        return min(self.timeout, remaining) if self.timeout else remaining
+
+    def _get_kernel_name(self, nb):
+        return self.kernel_name or nb.metadata.get("kernelspec", {}).get("name", "")
+
+    def _is_independent(self, cell):
+        return self.independent_tag in cell.metadata.get("tags", [])
+
+
+class CellCache:
+    """Outputs of code cells keyed by a rolling hash of the code cells sources
+
+    The key of a cell covers its source and the source of all the code cells
+    before it, so a hit means the kernel state would be the same.
+    Independent cells are keyed only by their own source. All the keys cover
+    the kernel name and the seed (see `Execute._get_cell_cache_seed`).
+    Entries not in cache_dir are read from the read-only shared_dirs and
+    copied to cache_dir.
+    """
+
+    def __init__(self, cache_dir, shared_dirs=()):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.shared_dirs = [pathlib.Path(shared_dir) for shared_dir in shared_dirs]
+
+    def keys(self, nb, kernel_name, independent_tag, seed=""):
+        """Return a dict of cell index to cache key for all executable cells"""
+        keys = {}
+        seed = f"kernel={kernel_name}\n{seed}".encode()
+        rolling = hashlib.sha256(seed)
+        for index, cell in enumerate(nb.cells):
+            if cell.cell_type != "code" or not cell.source.strip():
+                continue
+            if independent_tag in cell.metadata.get("tags", []):
+                hasher = hashlib.sha256(seed)
+                hasher.update(f"independent={cell.source}".encode())
+                keys[index] = hasher.hexdigest()
+            else:
+                rolling.update(hashlib.sha256(cell.source.encode()).digest())
+                keys[index] = rolling.hexdigest()
+        return keys
+
+    def load(self, key):
+        path = self._get_path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return self._load_shared(key)
+        # The modification time is the last use for the cache garbage collection
+        path.touch()
+        return entry
+
+    def _load_shared(self, key):
+        for shared_dir in self.shared_dirs:
+            try:
+                text = (shared_dir / f"{key}.json").read_text(encoding="utf-8")
+                entry = json.loads(text)
+            except (OSError, ValueError):
+                continue
+            path = self._get_path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text, encoding="utf-8")
+            return entry
+        return None
+
+    def save(self, key, cell, metadata=None):
+        entry = {
+            "outputs": cell.outputs,
+            "execution_count": cell.execution_count,
+        }
+        if metadata and "widgets" in metadata:
+            entry["widgets"] = metadata["widgets"]
+        path = self._get_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(entry), encoding="utf-8")
+
+    def _get_path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+
+def _write_once(path, data):
+    """Write a content-addressed file unless it already exists"""
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Notebooks can be converted in parallel, write the file in one step
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _truncate(text, max_lines=0, max_bytes=0):
+    """Return the head and tail of a text over the limits or None if it is not
+
+    Half of the limits is used for the head and half for the tail, the
+    omitted lines are replaced with a notice.
+    """
+    lines = text.splitlines(keepends=True)
+    data = text.encode("utf-8")
+    if (not max_lines or len(lines) <= max_lines) and (
+        not max_bytes or len(data) <= max_bytes
+    ):
+        return None
+
+    head, tail = text, text
+    if max_lines:
+        head_lines = (max_lines + 1) // 2
+        head = "".join(lines[:head_lines])
+        tail = "".join(lines[len(lines) - (max_lines - head_lines) :])
+    if max_bytes:
+        head_bytes = (max_bytes + 1) // 2
+        tail_bytes = max_bytes - head_bytes
+        head = head.encode("utf-8")[:head_bytes].decode("utf-8", "ignore")
+        data = tail.encode("utf-8")
+        tail = data[len(data) - tail_bytes :].decode("utf-8", "ignore")
+    if len(head) + len(tail) >= len(text):
+        return None
+
+    omitted = text[len(head) : len(text) - len(tail)]
+    omitted_lines = omitted.count("\n")
+    if omitted_lines:
+        notice = f"[... {omitted_lines} lines truncated ...]\n"
+    else:
+        notice = f"[... {len(omitted.encode('utf-8'))} bytes truncated ...]\n"
+    if head and not head.endswith("\n"):
+        notice = "\n" + notice
+    return head + notice + tail
+
+
+def _prune_widget_state(nb, state):
+    """Return the state of the displayed widget models and the models linked to them
+
+    The models referenced by a kept model are kept, and so are the models that
+    reference a kept model without being displayed (e.g. jslink and Link).
+    """
+    model_ids = [
+        output.data[WIDGET_VIEW_MIMETYPE]["model_id"]
+        for cell in nb.cells
+        for output in cell.get("outputs", [])
+        if WIDGET_VIEW_MIMETYPE in output.get("data", {})
+    ]
+    used = set()
+    while model_ids:
+        while model_ids:
+            model_id = model_ids.pop()
+            if model_id in used or model_id not in state:
+                continue
+            used.add(model_id)
+            model_ids.extend(_find_model_refs(state[model_id]))
+        model_ids = [
+            model_id
+            for model_id in state
+            if model_id not in used
+            and any(ref in used for ref in _find_model_refs(state[model_id]))
+        ]
+    return {model_id: state[model_id] for model_id in state if model_id in used}
+
+
+def _find_model_refs(value):
+    """Yield the IDs of the models referenced by a widget state"""
+    if isinstance(value, str):
+        if value.startswith("IPY_MODEL_"):
+            yield value[len("IPY_MODEL_") :]
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _find_model_refs(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _find_model_refs(item)
+
+
+def _restore_cell(cell, entry):
+    cell.outputs = [nbformat.from_dict(output) for output in entry["outputs"]]
+    cell.execution_count = entry["execution_count"]
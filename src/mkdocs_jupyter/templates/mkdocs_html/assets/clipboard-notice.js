@@ -0,0 +1,7 @@
+document.addEventListener('clipboard-copy', function(event) {
+  const notice = event.target.querySelector('.notice')
+  notice.hidden = false
+  setTimeout(function() {
+    notice.hidden = true
+  }, 1000)
+})
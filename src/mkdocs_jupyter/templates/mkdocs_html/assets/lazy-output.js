@@ -0,0 +1,84 @@
+// Loads the large notebook outputs when they are scrolled into view
+// The placeholders are rendered by notebook.html.j2 for the outputs written to
+// files with the lazy_outputs option
+(function () {
+  const SELECTOR = ".mkdocs-jupyter-lazy[data-src]";
+
+  // Scripts added with innerHTML do not run, recreate them in order so
+  // inline scripts can use the libraries loaded by the previous ones
+  async function runScripts(element) {
+    for (const old of element.querySelectorAll("script")) {
+      const script = document.createElement("script");
+      for (const attr of old.attributes) {
+        script.setAttribute(attr.name, attr.value);
+      }
+      script.text = old.text;
+      const loaded = script.src
+        ? new Promise(function (resolve) {
+            script.onload = script.onerror = resolve;
+          })
+        : null;
+      old.replaceWith(script);
+      if (loaded) {
+        await loaded;
+      }
+    }
+  }
+
+  async function load(element) {
+    const response = await fetch(element.dataset.src);
+    if (!response.ok) {
+      throw new Error(response.statusText);
+    }
+    const content = await response.text();
+    if (element.dataset.mimeType === "application/javascript") {
+      // Same as the inline JavaScript outputs of the lab template
+      const script = document.createElement("script");
+      script.text = `var element = document.getElementById(${JSON.stringify(
+        element.id
+      )});\n${content}`;
+      element.appendChild(script);
+    } else {
+      element.innerHTML = content;
+      await runScripts(element);
+    }
+  }
+
+  function mount(element) {
+    element.classList.remove("mkdocs-jupyter-lazy");
+    load(element).catch(function (error) {
+      element.textContent = `Could not load output: ${error.message}`;
+    });
+  }
+
+  function observe() {
+    const elements = document.querySelectorAll(SELECTOR);
+    if (!("IntersectionObserver" in window)) {
+      elements.forEach(mount);
+      return;
+    }
+    const observer = new IntersectionObserver(
+      function (entries) {
+        for (const entry of entries) {
+          if (entry.isIntersecting) {
+            observer.unobserve(entry.target);
+            mount(entry.target);
+          }
+        }
+      },
+      { rootMargin: "200px" }
+    );
+    elements.forEach(function (element) {
+      observer.observe(element);
+    });
+  }
+
+  // mkdocs-material instant navigation replaces the page without a new load
+  if (window.document$) {
+    window.document$.subscribe(observe);
+  } else if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", observe);
+  } else {
+    observe();
+  }
+})();
@@ -0,0 +1,59 @@
+// Loads the widget state written to a file with the widget_state: external
+// option and the widgets renderer when a widget is scrolled into view
+(function () {
+  const PLACEHOLDER = 'script[type="application/vnd.mkdocs-jupyter.widget-state"]';
+
+  async function load(placeholder) {
+    const response = await fetch(placeholder.dataset.src);
+    if (!response.ok) {
+      throw new Error(response.statusText);
+    }
+    // The renderer reads the state from this script when it is loaded
+    const state = document.createElement("script");
+    state.type = "application/vnd.jupyter.widget-state+json";
+    state.text = await response.text();
+    placeholder.replaceWith(state);
+    const renderer = document.createElement("script");
+    renderer.src = placeholder.dataset.renderer;
+    document.body.appendChild(renderer);
+  }
+
+  function mount(placeholder) {
+    load(placeholder).catch(function (error) {
+      console.error(`Could not load the widget state: ${error.message}`);
+    });
+  }
+
+  function observe() {
+    const placeholder = document.querySelector(PLACEHOLDER);
+    const views = document.querySelectorAll(".jupyter-widgets");
+    if (!placeholder || !views.length) {
+      return;
+    }
+    if (!("IntersectionObserver" in window)) {
+      mount(placeholder);
+      return;
+    }
+    const observer = new IntersectionObserver(
+      function (entries) {
+        if (entries.some((entry) => entry.isIntersecting)) {
+          observer.disconnect();
+          mount(placeholder);
+        }
+      },
+      { rootMargin: "200px" }
+    );
+    views.forEach(function (view) {
+      observer.observe(view);
+    });
+  }
+
+  // mkdocs-material instant navigation replaces the page without a new load
+  if (window.document$) {
+    window.document$.subscribe(observe);
+  } else if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", observe);
+  } else {
+    observe();
+  }
+})();
@@ -0,0 +1,57 @@
+import os
+
+import nbformat
+import pytest
+from mkdocs.config import load_config
+from nbformat.v4 import new_notebook
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+@pytest.fixture
+def site_config(tmp_path):
+    """Return a function that loads the config of a test site
+
+    The argument is the name of a config in tests/mkdocs, without it the site
+    is tmp_path/docs (see `write_notebook`). The site and the cache are
+    written to tmp_path, keyword arguments override the plugin options.
+    Every call returns a new config with a new plugin instance.
+    """
+
+    def load(config_file=None, **options):
+        if config_file is None:
+            config_file = tmp_path / "mkdocs.yml"
+            config_file.write_text("site_name: test\nplugins:\n  - mkdocs-jupyter\n")
+        else:
+            config_file = os.path.join(this_dir, "mkdocs", config_file)
+        cfg = load_config(str(config_file), site_dir=str(tmp_path / "site"))
+        if "mkdocs-jupyter" in cfg["plugins"]:
+            plugin_config = cfg["plugins"]["mkdocs-jupyter"].config
+            plugin_config["cache_dir"] = str(tmp_path / "cache")
+            plugin_config.update(options)
+        return cfg
+
+    return load
+
+
+@pytest.fixture
+def write_notebook(tmp_path):
+    """Return a function that writes a Python notebook to tmp_path/docs
+
+    It takes the name of the notebook, its cells and extra metadata and
+    returns the path of the notebook.
+    """
+    docs_dir = tmp_path / "docs"
+
+    def write(name, cells, **metadata):
+        metadata["kernelspec"] = {
+            "name": "python3",
+            "language": "python",
+            "display_name": "Python 3",
+        }
+        docs_dir.mkdir(exist_ok=True)
+        nb_path = docs_dir / f"{name}.ipynb"
+        nbformat.write(new_notebook(cells=cells, metadata=metadata), str(nb_path))
+        return nb_path
+
+    return write
@@ -1,9 +1,12 @@
+import json
 import os
 
 import pytest
 from mkdocs.commands.build import build
-from mkdocs.config import load_config
 from nbclient.exceptions import CellExecutionError
+from nbformat.v4 import new_code_cell, new_markdown_cell, new_output
+
+from mkdocs_jupyter.plugin import worker_pool
 
 
 @pytest.mark.parametrize(
@@ -15,6 +18,7 @@ from nbclient.exceptions import CellExecutionError
         ["base-with-mds.yml", True],
         ["base-without-nbs.yml", True],
         ["material-execute-ignore.yml", True],
+        ["material-kernel-pool.yml", True],
         ["material-with-nbs-pys.yml", True],
         ["material-with-nbs.yml", True],
         ["material-with-pys.yml", True],
@@ -23,14 +27,157 @@ from nbclient.exceptions import CellExecutionError
     ],
     ids=lambda x: x[0],
 )
-def test_notebook_renders(input):
+def test_notebook_renders(input, site_config):
     filename, should_work = input
 
-    this_dir = os.path.dirname(os.path.realpath(__file__))
-    config_file = os.path.join(this_dir, f"mkdocs/{filename}")
-
     try:
-        build(load_config(config_file))
+        build(site_config(filename))
         assert should_work
     except CellExecutionError:
         assert not should_work
+
+
+def test_notebook_renders_with_workers(tmp_path, site_config):
+    def load_workers_config():
+        return site_config("base-with-nbs-pys.yml", workers=2, cache=False)
+
+    cfg = load_workers_config()
+    try:
+        build(cfg)
+        executor = worker_pool.get(2)
+        # mkdocs serve creates a new plugin when the config changes
+        build(load_workers_config())
+        assert worker_pool.get(2) is executor
+    finally:
+        cfg["plugins"]["mkdocs-jupyter"].on_shutdown()
+
+    demo_page = tmp_path / "site" / "demo" / "index.html"
+    assert "jupyter-wrapper" in demo_page.read_text(encoding="utf-8")
+
+
+def test_external_assets(tmp_path, site_config):
+    build(site_config("base-with-nbs.yml", external_assets=True, cache=False))
+
+    site_dir = tmp_path / "site"
+    assets = sorted(
+        (site_dir / "assets" / "mkdocs-jupyter").iterdir(), key=lambda p: p.suffix
+    )
+    assert [asset.suffix for asset in assets] == [".css", ".js"]
+
+    html = (site_dir / "demo" / "index.html").read_text(encoding="utf-8")
+    assert f'href="../assets/mkdocs-jupyter/{assets[0].name}"' in html
+    assert f'src="../assets/mkdocs-jupyter/{assets[1].name}"' in html
+    assert "clipboard-copy" not in assets[0].read_text(encoding="utf-8")
+    assert html.count("<style") < 5
+
+
+@pytest.mark.parametrize("use_cache", [False, True])
+def test_extract_outputs(tmp_path, site_config, use_cache):
+    build(site_config("base-with-nbs.yml", extract_outputs=True, cache=use_cache))
+
+    site_dir = tmp_path / "site"
+    outputs = list((site_dir / "assets" / "mkdocs-jupyter" / "outputs").iterdir())
+    assert outputs
+    html = (site_dir / "demo" / "index.html").read_text(encoding="utf-8")
+    assert '<img src="data:image/png;base64' not in html
+    for output in outputs:
+        if f"../assets/mkdocs-jupyter/outputs/{output.name}" in html:
+            break
+    else:
+        raise AssertionError("No extracted output linked from the page")
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_timing_report(tmp_path, site_config, workers):
+    report_path = tmp_path / "timing.json"
+    build(
+        site_config(
+            "base-with-nbs.yml", timing_report=str(report_path), workers=workers
+        )
+    )
+
+    report = json.loads(report_path.read_text())
+    assert report["build"]["misses"] == len(report["notebooks"])
+    demo = next(t for t in report["notebooks"] if t["path"] == "demo.ipynb")
+    assert demo["cache"] == "miss"
+    assert demo["html_bytes"] > 0
+    assert {"read", "export", "toc", "hash"} <= set(demo["stages"])
+
+
+def test_execute_timeout_fallback(tmp_path, site_config, write_notebook):
+    slow = tmp_path / "slow"
+    source = (
+        f"import os, time\nif os.path.exists({str(slow)!r}):\n"
+        "    time.sleep(60)\nprint('executed')"
+    )
+    cells = [
+        new_markdown_cell("# Slow"),
+        new_code_cell(
+            source,
+            outputs=[new_output("stream", name="stdout", text="stored\n")],
+        ),
+    ]
+    write_notebook("slow", cells)
+    page = tmp_path / "site" / "slow" / "index.html"
+
+    def build_page():
+        build(site_config(execute=True, execute_timeout=5))
+        html = page.read_text(encoding="utf-8")
+        return [text for text in ("stored", "executed") if f"{text}\n" in html]
+
+    # Without a previous execution the outputs of the notebook are used
+    slow.touch()
+    assert build_page() == ["stored"]
+
+    slow.unlink()
+    assert build_page() == ["executed"]
+
+    # The timed out notebook uses the outputs of the last execution
+    slow.touch()
+    write_notebook("slow", [*cells, new_markdown_cell("Changed")])
+    assert build_page() == ["executed"]
+
+
+def test_execute_auto(tmp_path, site_config, write_notebook):
+    stored = new_output("stream", name="stdout", text="stored\n")
+    for name, outputs in (("with-outputs", [stored]), ("stripped", [])):
+        write_notebook(name, [new_code_cell("print('executed')", outputs=outputs)])
+    marker = tmp_path / "marker"
+
+    def build_pages():
+        build(site_config(execute="auto", execute_auto_marker=str(marker), cache=False))
+        outputs = {}
+        for name in ("with-outputs", "stripped"):
+            page = tmp_path / "site" / name / "index.html"
+            html = page.read_text(encoding="utf-8")
+            outputs[name] = "stored" if "stored\n" in html else "executed"
+        return outputs
+
+    assert build_pages() == {"with-outputs": "stored", "stripped": "executed"}
+
+    # Notebooks older than the marker are executed
+    os.utime(tmp_path / "docs" / "with-outputs.ipynb", ns=(0, 0))
+    marker.touch()
+    assert build_pages() == {"with-outputs": "executed", "stripped": "executed"}
+
+
+def test_cell_cache_dependencies(tmp_path, site_config, write_notebook):
+    """Cells are executed again when a dependency of the notebook changes"""
+    write_notebook(
+        "data",
+        [new_code_cell("print(open('data.txt').read())")],
+        mkdocs_jupyter={"dependencies": ["data.txt"]},
+    )
+
+    def build_page():
+        build(site_config(execute=True, cache=True, cell_cache=True))
+        page = tmp_path / "site" / "data" / "index.html"
+        return page.read_text(encoding="utf-8")
+
+    (tmp_path / "docs" / "data.txt").write_text("hello")
+    assert "hello" in build_page()
+
+    (tmp_path / "docs" / "data.txt").write_text("world")
+    html = build_page()
+    assert "world" in html
+    assert "hello" not in html
@@ -1,12 +1,19 @@
 import json
 import os
 import pathlib
-import tempfile
+import time
 from unittest.mock import patch
 
 import pytest
 
-from mkdocs_jupyter.plugin import _compute_cache_key, _get_cache_path
+from mkdocs_jupyter import cache
+from mkdocs_jupyter.cache import _get_cache_path
+from mkdocs_jupyter.plugin import (
+    _compute_cache_key,
+    _compute_executed_key,
+    _get_nb_dependencies,
+    _hash_file,
+)
 
 
 @pytest.fixture
@@ -47,6 +54,7 @@ def base_config():
         "remove_tag_config": {},
         "highlight_extra_classes": "",
         "include_requirejs": False,
+        "include_clipboard_text": True,
         "custom_mathjax_url": "",
         "toc_depth": 6,
     }
@@ -101,6 +109,67 @@ class TestComputeCacheKey:
         assert key1 != key2
 
 
+class TestComputeExecutedKey:
+    def test_presentation_options_do_not_change_key(self, sample_nb, base_config):
+        config2 = {**base_config, "theme": "dark", "highlight_extra_classes": "x"}
+        assert _compute_executed_key(
+            str(sample_nb), base_config, True
+        ) == _compute_executed_key(str(sample_nb), config2, True)
+        assert _compute_cache_key(
+            str(sample_nb), base_config, True
+        ) != _compute_cache_key(str(sample_nb), config2, True)
+
+    def test_execution_options_change_key(self, sample_nb, base_config):
+        config2 = {**base_config, "allow_errors": False}
+        key = _compute_executed_key(str(sample_nb), base_config, True)
+        assert key != _compute_executed_key(str(sample_nb), config2, True)
+        config3 = {**base_config, "remove_tag_config": {"remove_cell_tags": ["x"]}}
+        assert key != _compute_executed_key(str(sample_nb), config3, True)
+        assert key != _compute_executed_key(str(sample_nb), base_config, False)
+
+
+class TestDependencies:
+    def test_dependency_content_changes_key(self, sample_nb, base_config, tmp_path):
+        data = tmp_path / "data"
+        data.mkdir()
+        (data / "a.csv").write_text("x\n1\n")
+        dependencies = [str(data / "*.csv")]
+
+        def key(exec_nb=True):
+            return _compute_cache_key(
+                str(sample_nb), base_config, exec_nb, dependencies=dependencies
+            )
+
+        key1 = key()
+        assert key1 != _compute_cache_key(str(sample_nb), base_config, True)
+
+        (data / "a.csv").write_text("x\n2\n")
+        key2 = key()
+        assert key2 != key1
+
+        (data / "b.csv").write_text("x\n3\n")
+        assert key() != key2
+
+        # Dependencies only matter when the notebook is executed
+        assert key(exec_nb=False) == _compute_cache_key(
+            str(sample_nb), base_config, False
+        )
+
+    def test_dependencies_from_metadata(self, sample_nb, tmp_path):
+        nb = json.loads(sample_nb.read_text())
+        nb["metadata"]["mkdocs_jupyter"] = {"dependencies": ["data/*.csv"]}
+        sample_nb.write_text(json.dumps(nb))
+
+        manifest = {}
+        dependencies = _get_nb_dependencies(str(sample_nb), manifest)
+        assert dependencies == [str(tmp_path / "data" / "*.csv")]
+
+        # Read from the manifest while the notebook does not change
+        with patch("mkdocs_jupyter.convert.read_notebook") as mock_read:
+            assert _get_nb_dependencies(str(sample_nb), manifest) == dependencies
+            mock_read.assert_not_called()
+
+
 class TestGetCachePath:
     def test_returns_json_path(self):
         path = _get_cache_path("/tmp/cache", "abc123")
@@ -111,90 +180,383 @@ class TestGetCachePath:
         assert str(path) == ".cache/mkdocs-jupyter/deadbeef.json"
 
 
+class TestManifest:
+    def test_unchanged_stat_uses_manifest(self, sample_nb):
+        manifest = {}
+        digest = _hash_file(str(sample_nb), manifest)
+        assert manifest[str(sample_nb)]["sha256"] == digest
+
+        # The stored digest is trusted while the stat does not change
+        manifest[str(sample_nb)]["sha256"] = "stale"
+        assert _hash_file(str(sample_nb), manifest) == "stale"
+        assert _hash_file(str(sample_nb), manifest, verify=True) == digest
+
+    def test_changed_stat_rehashes(self, sample_nb):
+        manifest = {}
+        digest = _hash_file(str(sample_nb), manifest)
+        manifest[str(sample_nb)]["sha256"] = "stale"
+
+        sample_nb.write_text(sample_nb.read_text() + "\n")
+        new_digest = _hash_file(str(sample_nb), manifest)
+        assert new_digest not in (digest, "stale")
+
+    def test_key_uses_manifest(self, sample_nb, base_config):
+        manifest = {}
+        key1 = _compute_cache_key(str(sample_nb), base_config, False, manifest=manifest)
+        assert key1 == _compute_cache_key(str(sample_nb), base_config, False)
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    store = cache.get_store(request.param, tmp_path)
+    yield store
+    store.close()
+
+
+def _entry(content="<p>Hello</p>"):
+    return {"content": content, "toc_tokens": [], "title": "Hello", "outputs": []}
+
+
+class TestStores:
+    def test_put_get(self, store):
+        assert "a" * 64 not in store
+        assert store.get("a" * 64) is None
+
+        store.put("a" * 64, _entry())
+        assert "a" * 64 in store
+        assert store.get("a" * 64) == _entry()
+
+    def test_evict_unused(self, store):
+        store.put("a" * 64, _entry())
+        store.put("b" * 64, _entry())
+
+        assert cache.evict(store, {"a" * 64}) == ["b" * 64]
+        assert "a" * 64 in store
+        assert "b" * 64 not in store
+
+    def test_evict_lru_over_max_size(self, store):
+        for i, key in enumerate(["a" * 64, "b" * 64, "c" * 64]):
+            store.put(key, _entry(content=f"<p>{i}</p>" * 100))
+        # Make the first entry the most recently used
+        time.sleep(0.05)
+        store.touch(["a" * 64])
+
+        max_size = sum(size for _, size, _ in store.entries()) - 1
+        assert cache.evict(store, set(), max_size) == ["b" * 64]
+        assert "a" * 64 in store and "c" * 64 in store
+
+    def test_get_does_not_write(self, store):
+        store.put("a" * 64, _entry())
+        ((_, _, last_used),) = store.entries()
+        time.sleep(0.05)
+        assert store.get("a" * 64) == _entry()
+        assert store.entries()[0][2] == last_used
+
+        store.touch(["a" * 64])
+        assert store.entries()[0][2] > last_used
+
+    def test_memory_cache_lru(self):
+        memory = cache.MemoryCache(2)
+        memory.put("a", _entry())
+        memory.put("b", _entry())
+        memory.get("a")
+        memory.put("c", _entry())
+        assert "a" in memory and "c" in memory
+        assert "b" not in memory
+
+        memory = cache.MemoryCache(0)
+        memory.put("a", _entry())
+        assert memory.get("a") is None
+
+    def test_parse_size(self):
+        assert cache.parse_size(1000) == 1000
+        assert cache.parse_size("500MB") == 500 * 1024**2
+        assert cache.parse_size("2g") == 2 * 1024**3
+        with pytest.raises(ValueError):
+            cache.parse_size("lots")
+
+
+class TestRetention:
+    def test_keep_builds(self, store):
+        store.put("a" * 64, _entry())
+        time.sleep(0.05)
+        builds = [{"start": time.time()}]
+        store.put("b" * 64, _entry())
+
+        assert cache.evict(store, set(), keep_builds=2, builds=builds) == []
+        assert cache.evict(store, set(), keep_builds=1, builds=builds) == ["a" * 64]
+
+    def test_max_age(self, store):
+        store.put("a" * 64, _entry())
+        assert cache.evict(store, set(), max_age=3600) == []
+        time.sleep(1.1)
+        assert cache.evict(store, {"a" * 64}, max_age=1) == []
+        assert cache.evict(store, set(), max_age=1) == ["a" * 64]
+
+    def test_evict_cells(self, tmp_path):
+        cells_dir = tmp_path / "cells"
+        cells_dir.mkdir()
+        old, new = cells_dir / "old.json", cells_dir / "new.json"
+        old.write_text("{}")
+        os.utime(old, (0, 0))
+        new.write_text("{}")
+
+        assert cache.evict_cells(tmp_path) == []
+        assert cache.evict_cells(tmp_path, max_age=3600) == ["old"]
+        assert new.exists()
+
+    def test_record_build(self, tmp_path):
+        cache.record_build(tmp_path, {"start": 1, "hits": 1, "misses": 0, "pages": {}})
+        builds = cache.record_build(
+            tmp_path, {"start": 2, "hits": 0, "misses": 1, "pages": {"a": "nb.ipynb"}}
+        )
+        assert builds == cache.load_builds(tmp_path)
+        assert "pages" not in builds[0]
+        assert builds[1]["pages"] == {"a": "nb.ipynb"}
+
+    def test_cli(self, tmp_path, capsys):
+        store = cache.JSONStore(tmp_path)
+        store.put("a" * 64, _entry())
+        os.utime(_get_cache_path(tmp_path, "a" * 64), (0, 0))
+        store.put("b" * 64, _entry())
+        cache.record_build(
+            tmp_path,
+            {"start": 1, "hits": 3, "misses": 1, "pages": {"b" * 64: "nb.ipynb"}},
+        )
+
+        assert cache.main(["--cache-dir", str(tmp_path), "stats"]) == 0
+        out = capsys.readouterr().out
+        assert "Entries: 2" in out
+        assert "3 hits, 1 misses" in out
+        assert "nb.ipynb" in out
+
+        assert cache.main(["--cache-dir", str(tmp_path), "gc", "--max-age", "1d"]) == 0
+        assert "evicted 1 entries" in capsys.readouterr().out
+        assert "a" * 64 not in store and "b" * 64 in store
+
+        with pytest.raises(SystemExit):
+            cache.main(["--cache-dir", str(tmp_path), "gc"])
+
+    def test_cli_executed_and_outputs(self, tmp_path, capsys):
+        store = cache.JSONStore(tmp_path)
+        store.put("a" * 64, {**_entry(), "outputs": ["linked.png"]})
+        outputs_dir = tmp_path / "outputs"
+        outputs_dir.mkdir()
+        executed_dir = tmp_path / "executed"
+        executed_dir.mkdir()
+        for path in (
+            outputs_dir / "linked.png",
+            outputs_dir / "old.png",
+            outputs_dir / "recent.png",
+            executed_dir / f"{'b' * 64}.ipynb",
+            executed_dir / f"{'c' * 64}.ipynb",
+        ):
+            path.write_bytes(b"x" * 10)
+        for path in (
+            outputs_dir / "linked.png",
+            outputs_dir / "old.png",
+            executed_dir / f"{'b' * 64}.ipynb",
+        ):
+            os.utime(path, (0, 0))
+
+        assert cache.main(["--cache-dir", str(tmp_path), "stats"]) == 0
+        out = capsys.readouterr().out
+        assert "Executed notebooks: 2 (20 B)" in out
+        assert "Outputs: 3 (30 B)" in out
+
+        assert cache.main(["--cache-dir", str(tmp_path), "gc", "--max-age", "1d"]) == 0
+        out = capsys.readouterr().out
+        assert "Executed notebooks: evicted 1 entries" in out
+        assert "Outputs: evicted 1 files" in out
+        assert sorted(path.name for path in outputs_dir.iterdir()) == [
+            "linked.png",
+            "recent.png",
+        ]
+        assert [path.stem for path in executed_dir.iterdir()] == ["c" * 64]
+
+
+class TestSharedCache:
+    @pytest.mark.parametrize("shared_backend", ["json", "sqlite"])
+    def test_layered_read_through(self, tmp_path, shared_backend):
+        shared_store = cache.get_store(shared_backend, tmp_path / "shared")
+        shared_store.put("a" * 64, _entry())
+        shared_entries = shared_store.entries()
+        shared_store.close()
+
+        store = cache.get_store("json", tmp_path / "local", [tmp_path / "shared"])
+        assert "a" * 64 in store
+        assert "a" * 64 not in store.local
+        assert store.get("a" * 64) == _entry()
+        store.close()
+
+        # Written back to the local store, the shared store is not modified
+        assert cache.JSONStore(tmp_path / "local").get("a" * 64) == _entry()
+        shared_store = cache.get_store(shared_backend, tmp_path / "shared")
+        assert shared_store.entries() == shared_entries
+        shared_store.close()
+
+    def test_shared_executed_notebooks(self, tmp_path, site_config):
+        """A page missing from the shared cache uses its executed notebook."""
+        from mkdocs.commands.build import build
+
+        shared_dir = tmp_path / "shared"
+        config_file = "material-execute-ignore.yml"
+        build(site_config(config_file, cache=True, cache_dir=str(shared_dir)))
+
+        cfg = site_config(
+            config_file,
+            cache=True,
+            cache_shared_dirs=[str(shared_dir)],
+            highlight_extra_classes="custom-class",
+        )
+        with patch("mkdocs_jupyter.convert.execute_notebook") as mock_execute:
+            build(cfg)
+            mock_execute.assert_not_called()
+        assert list((tmp_path / "cache" / "executed").glob("*.ipynb"))
+
+    def test_export_import(self, tmp_path, capsys):
+        src = tmp_path / "src"
+        cache.JSONStore(src).put("a" * 64, _entry())
+        sqlite_store = cache.SQLiteStore(src)
+        sqlite_store.put("b" * 64, _entry())
+        sqlite_store.close()
+        (src / "cells").mkdir()
+        (src / "cells" / "cell.json").write_text("{}")
+        cache.record_build(src, {"start": 1, "hits": 0, "misses": 2, "pages": {}})
+
+        dest = tmp_path / "dest"
+        sqlite_store = cache.SQLiteStore(dest)
+        sqlite_store.put("c" * 64, _entry())
+        sqlite_store.close()
+
+        archive = str(tmp_path / "cache.tar.gz")
+        assert cache.main(["--cache-dir", str(src), "export", archive]) == 0
+        assert cache.main(["--cache-dir", str(dest), "import", archive]) == 0
+        assert "Imported 3 entries" in capsys.readouterr().out
+
+        assert cache.JSONStore(dest).get("a" * 64) == _entry()
+        sqlite_store = cache.SQLiteStore(dest)
+        assert "b" * 64 in sqlite_store and "c" * 64 in sqlite_store
+        sqlite_store.close()
+        assert (dest / "cells" / "cell.json").exists()
+        assert not (dest / "builds.json").exists()
+
+
 class TestCacheIntegration:
     """Integration tests using full mkdocs build."""
 
-    def test_cache_populated_on_first_build(self):
+    def test_cache_populated_on_first_build(self, tmp_path, site_config):
         """First build should create cache files."""
         from mkdocs.commands.build import build
-        from mkdocs.config import load_config
 
-        this_dir = os.path.dirname(os.path.realpath(__file__))
-        config_file = os.path.join(this_dir, "mkdocs/base-with-nbs.yml")
+        build(site_config("base-with-nbs.yml", cache=True))
 
-        with tempfile.TemporaryDirectory() as cache_dir:
-            cfg = load_config(config_file)
-            cfg["plugins"]["mkdocs-jupyter"].config["cache"] = True
-            cfg["plugins"]["mkdocs-jupyter"].config["cache_dir"] = cache_dir
+        cache_files = list((tmp_path / "cache").glob("*.json"))
+        assert len(cache_files) > 0, "Cache files should be created on first build"
 
-            build(cfg)
-
-            cache_files = list(pathlib.Path(cache_dir).glob("*.json"))
-            assert len(cache_files) > 0, "Cache files should be created on first build"
-
-    def test_cache_hit_on_second_build(self):
+    def test_cache_hit_on_second_build(self, site_config):
         """Second build should use cached results (nb2html not called again)."""
         from mkdocs.commands.build import build
-        from mkdocs.config import load_config
 
-        this_dir = os.path.dirname(os.path.realpath(__file__))
-        config_file = os.path.join(this_dir, "mkdocs/base-with-nbs.yml")
+        # First build populates cache
+        build(site_config("base-with-nbs.yml", cache=True))
 
-        with tempfile.TemporaryDirectory() as cache_dir:
-            cfg = load_config(config_file)
-            cfg["plugins"]["mkdocs-jupyter"].config["cache"] = True
-            cfg["plugins"]["mkdocs-jupyter"].config["cache_dir"] = cache_dir
-
-            # First build populates cache
+        # Second build should hit cache — nb2html should not be called
+        cfg = site_config("base-with-nbs.yml", cache=True)
+        with patch("mkdocs_jupyter.convert.nb2html") as mock_nb2html:
             build(cfg)
+            mock_nb2html.assert_not_called()
 
-            # Second build should hit cache — nb2html should not be called
-            cfg2 = load_config(config_file)
-            cfg2["plugins"]["mkdocs-jupyter"].config["cache"] = True
-            cfg2["plugins"]["mkdocs-jupyter"].config["cache_dir"] = cache_dir
+    def test_sqlite_cache_hit_on_second_build(self, tmp_path, site_config):
+        from mkdocs.commands.build import build
 
-            with patch("mkdocs_jupyter.convert.nb2html") as mock_nb2html:
-                build(cfg2)
-                mock_nb2html.assert_not_called()
+        def load_sqlite_config():
+            return site_config("base-with-nbs.yml", cache=True, cache_backend="sqlite")
 
-    def test_cache_disabled(self):
-        """When cache=False, no cache files should be created."""
+        build(load_sqlite_config())
+
+        with patch("mkdocs_jupyter.convert.nb2html") as mock_nb2html:
+            build(load_sqlite_config())
+            mock_nb2html.assert_not_called()
+
+        cache_dir = tmp_path / "cache"
+        assert (cache_dir / "index.sqlite").exists()
+        assert cache.JSONStore(cache_dir).entries() == []
+
+    def test_dirty_build_keeps_skipped_pages(self, tmp_path, site_config):
+        """Pages skipped by a dirty build are not evicted from the cache."""
         from mkdocs.commands.build import build
-        from mkdocs.config import load_config
 
-        this_dir = os.path.dirname(os.path.realpath(__file__))
-        config_file = os.path.join(this_dir, "mkdocs/base-with-nbs.yml")
+        cache_dir = tmp_path / "cache"
+        build(site_config("base-with-nbs.yml", cache=True))
+        entries = set(cache_dir.glob("*.json"))
+
+        cfg = site_config("base-with-nbs.yml", cache=True)
+        cfg["plugins"]["mkdocs-jupyter"]._dirty = True
+        with patch("mkdocs_jupyter.convert.nb2html") as mock_nb2html:
+            build(cfg, dirty=True)
+            mock_nb2html.assert_not_called()
+
+        assert set(cache_dir.glob("*.json")) == entries
+        builds = cache.load_builds(cache_dir)
+        assert len(builds) == 2
+        assert builds[-1]["hits"] == builds[-1]["misses"] == 0
+
+    def test_presentation_change_does_not_execute(self, tmp_path, site_config):
+        """Executed notebooks are cached apart from the rendered HTML."""
+        from mkdocs.commands.build import build
 
-        with tempfile.TemporaryDirectory() as cache_dir:
-            cfg = load_config(config_file)
-            cfg["plugins"]["mkdocs-jupyter"].config["cache"] = False
-            cfg["plugins"]["mkdocs-jupyter"].config["cache_dir"] = cache_dir
+        config_file = "material-execute-ignore.yml"
+        build(site_config(config_file, cache=True))
+        assert list((tmp_path / "cache" / "executed").glob("*.ipynb"))
 
+        cfg = site_config(
+            config_file, cache=True, highlight_extra_classes="custom-class"
+        )
+        with patch("mkdocs_jupyter.convert.execute_notebook") as mock_execute:
             build(cfg)
+            mock_execute.assert_not_called()
+        html = (tmp_path / "site" / "demo" / "index.html").read_text()
+        assert "custom-class" in html
+
+    def test_memory_cache_across_rebuilds(self, tmp_path, site_config):
+        """A rebuild with the same plugin instance does not read the store."""
+        from mkdocs.commands.build import build
 
-            cache_files = list(pathlib.Path(cache_dir).glob("*.json"))
-            assert len(cache_files) == 0, "No cache files when cache is disabled"
+        cfg = site_config("base-with-nbs.yml", cache=True)
+        build(cfg)
 
-    def test_stale_cache_evicted(self):
-        """Stale cache files from previous builds are cleaned up."""
+        with patch("mkdocs_jupyter.cache.JSONStore.get") as mock_get, patch(
+            "mkdocs_jupyter.convert.nb2html"
+        ) as mock_nb2html:
+            build(cfg)
+            mock_get.assert_not_called()
+            mock_nb2html.assert_not_called()
+        assert cache.load_builds(tmp_path / "cache")[-1]["misses"] == 0
+
+    def test_cache_disabled(self, tmp_path, site_config):
+        """When cache=False, no cache files should be created."""
         from mkdocs.commands.build import build
-        from mkdocs.config import load_config
 
-        this_dir = os.path.dirname(os.path.realpath(__file__))
-        config_file = os.path.join(this_dir, "mkdocs/base-with-nbs.yml")
+        build(site_config("base-with-nbs.yml", cache=False))
+
+        cache_files = list((tmp_path / "cache").glob("*.json"))
+        assert len(cache_files) == 0, "No cache files when cache is disabled"
 
-        with tempfile.TemporaryDirectory() as cache_dir:
-            # Plant a stale cache file
-            stale = pathlib.Path(cache_dir) / "stale_old_entry.json"
-            stale.write_text("{}")
+    def test_stale_cache_evicted(self, tmp_path, site_config):
+        """Stale cache files from previous builds are cleaned up."""
+        from mkdocs.commands.build import build
 
-            cfg = load_config(config_file)
-            cfg["plugins"]["mkdocs-jupyter"].config["cache"] = True
-            cfg["plugins"]["mkdocs-jupyter"].config["cache_dir"] = cache_dir
+        # Plant a stale cache file
+        cache_dir = tmp_path / "cache"
+        cache_dir.mkdir()
+        stale = cache_dir / "stale_old_entry.json"
+        stale.write_text("{}")
 
-            build(cfg)
+        build(site_config("base-with-nbs.yml", cache=True))
 
-            assert not stale.exists(), "Stale cache file should be evicted"
-            # But valid cache files should remain
-            cache_files = list(pathlib.Path(cache_dir).glob("*.json"))
-            assert len(cache_files) > 0
+        assert not stale.exists(), "Stale cache file should be evicted"
+        assert (cache_dir / "manifest.json").exists()
+        # But valid cache files should remain
+        cache_files = list(cache_dir.glob("*.json"))
+        assert len(cache_files) > 0
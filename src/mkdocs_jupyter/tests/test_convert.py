@@ -0,0 +1,189 @@
+import os
+from unittest.mock import patch
+
+import nbformat
+
+from mkdocs_jupyter import cache, convert, nbconvert2
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+docs_dir = os.path.join(this_dir, "mkdocs", "docs")
+
+
+def test_exporter_reused():
+    exporter = convert.get_html_exporter(theme="dark", remove_tag_config={})
+    assert convert.get_html_exporter(theme="dark", remove_tag_config={}) is exporter
+    assert convert.get_html_exporter(theme="light", remove_tag_config={}) is not exporter
+
+
+def test_exporters_bounded(monkeypatch):
+    monkeypatch.setattr(nbconvert2, "_exporters", cache.MemoryCache(2))
+    exporter_a = convert.get_html_exporter(highlight_extra_classes="a")
+    exporter_b = convert.get_html_exporter(highlight_extra_classes="b")
+    assert convert.get_html_exporter(highlight_extra_classes="a") is exporter_a
+    # The least recently used exporter is dropped
+    exporter_c = convert.get_html_exporter(highlight_extra_classes="c")
+    assert convert.get_html_exporter(highlight_extra_classes="a") is exporter_a
+    assert convert.get_html_exporter(highlight_extra_classes="b") is not exporter_b
+    assert convert.get_html_exporter(highlight_extra_classes="c") is not exporter_c
+
+
+def test_nbs2html():
+    nb_paths = [
+        os.path.join(docs_dir, "demo.ipynb"),
+        os.path.join(docs_dir, "demo-script.py"),
+    ]
+    contents = convert.nbs2html(nb_paths, theme="dark")
+    assert len(contents) == 2
+    for content in contents:
+        assert "jupyter-wrapper" in content
+        assert 'data-jp-theme-name="JupyterLab Dark"' in content
+
+
+def test_nbs2html_executes_every_notebook(write_notebook):
+    stored = nbformat.v4.new_output("stream", name="stdout", text="stored\n")
+    nb_path = str(
+        write_notebook(
+            "stored",
+            [nbformat.v4.new_code_cell("print('executed')", outputs=[stored])],
+        )
+    )
+
+    for content in convert.nbs2html([nb_path, nb_path], execute=True):
+        assert "executed\n" in content
+        assert content.count("stored\n") == 0
+
+
+def test_execute_notebook(tmp_path, write_notebook):
+    removed = tmp_path / "removed.txt"
+    nb_path = str(
+        write_notebook(
+            "test",
+            [
+                nbformat.v4.new_code_cell("print('executed')"),
+                nbformat.v4.new_code_cell(
+                    f"open({str(removed)!r}, 'w').write('x')",
+                    metadata={"tags": ["remove"]},
+                ),
+            ],
+        )
+    )
+    kwargs = {"remove_tag_config": {"remove_cell_tags": ["remove"]}}
+
+    executed = convert.execute_notebook(nb_path, **kwargs)
+    assert executed.cells[0].outputs[0]["text"] == "executed\n"
+    # Removed before the execution, the same as nb2html
+    assert len(executed.cells) == 1
+    assert not removed.exists()
+
+    # The nbconvert defaults that run before the execution in nb2html
+    preprocessors = nbconvert2.get_execute_preprocessors(**kwargs)
+    assert type(preprocessors[0]).__name__ == "TagRemovePreprocessor"
+    assert type(preprocessors[-1]).__name__ == "Execute"
+
+    # The exporter of the first execution is reused
+    with patch("mkdocs_jupyter.nbconvert2.HTMLExporter") as mock_exporter:
+        convert.execute_notebook(nb_path, **kwargs)
+        mock_exporter.assert_not_called()
+
+
+def test_nb2md_execute(tmp_path, write_notebook):
+    executed = tmp_path / "executed.txt"
+    nb_path = str(
+        write_notebook(
+            "test",
+            [
+                nbformat.v4.new_markdown_cell("# Title"),
+                nbformat.v4.new_code_cell(f"open({str(executed)!r}, 'w').write('x')"),
+            ],
+        )
+    )
+
+    assert "# Title" in convert.nb2md(nb_path)
+    assert not executed.exists()
+    assert "# Title" in convert.nb2md(nb_path, execute=True)
+    assert executed.exists()
+
+
+def test_lazy_outputs(tmp_path):
+    nb = nbformat.v4.new_notebook(
+        cells=[
+            nbformat.v4.new_code_cell(
+                "show()",
+                outputs=[
+                    nbformat.v4.new_output(
+                        "display_data", data={"text/html": "<div>large</div>"}
+                    )
+                ],
+            )
+        ]
+    )
+    outputs = {"dir": str(tmp_path), "url": "out", "images": False, "lazy_size": 1}
+    content = convert.nb2html(
+        os.path.join(docs_dir, "demo.ipynb"), nb=nb, outputs=outputs
+    )
+    (path,) = tmp_path.iterdir()
+    assert f'data-src="out/{path.name}"' in content
+    assert content.count("<div>large</div>") == 0
+    assert "mkdocs-jupyter-lazy[data-src]" in content
+
+
+def test_truncated_outputs(tmp_path):
+    text = "".join(f"step {i}\n" for i in range(1000))
+    nb = nbformat.v4.new_notebook(
+        cells=[
+            nbformat.v4.new_code_cell(
+                "train()",
+                outputs=[nbformat.v4.new_output("stream", name="stdout", text=text)],
+            )
+        ]
+    )
+    outputs = {"dir": str(tmp_path), "url": "out", "max_lines": 10}
+    content = convert.nb2html(
+        os.path.join(docs_dir, "demo.ipynb"), nb=nb, outputs=outputs
+    )
+    (path,) = tmp_path.iterdir()
+    assert f'href="out/{path.name}"' in content
+    assert "[... 990 lines truncated ...]" in content
+    assert content.count("step 500") == 0
+
+
+def test_external_widget_state(tmp_path):
+    nb = nbformat.v4.new_notebook()
+    nb.metadata["widgets"] = {
+        "application/vnd.jupyter.widget-state+json": {
+            "version_major": 2,
+            "version_minor": 0,
+            "state": {},
+        }
+    }
+    outputs = {"dir": str(tmp_path), "url": "out", "widget_state": "external"}
+    content = convert.nb2html(
+        os.path.join(docs_dir, "demo.ipynb"), nb=nb, outputs=outputs
+    )
+    (path,) = tmp_path.iterdir()
+    assert f'data-src="out/{path.name}"' in content
+    assert "html-manager@" in content
+    assert content.count('type="application/vnd.jupyter.widget-state+json"') == 0
+
+
+def test_highlight_cached():
+    highlight_code = convert.mk_custom_highlight_code()
+    source = "import os\nprint(os.getcwd())"
+    first = highlight_code(source, language="python")
+    hits = nbconvert2._highlight.cache_info().hits
+    second = highlight_code(source, language="python")
+
+    assert nbconvert2._highlight.cache_info().hits == hits + 1
+    # Only the ID of the clipboard text changes
+    assert first.split('<div id="cell-')[0] == second.split('<div id="cell-')[0]
+    assert 'class="highlight-ipynb hl-python' in first
+    assert nbconvert2._get_lexer("python") is nbconvert2._get_lexer("python")
+
+
+def test_no_clipboard_text():
+    highlight_code = convert.mk_custom_highlight_code(clipboard_text=False)
+    html = highlight_code("print('a < b')", language="python")
+
+    assert html.startswith('<div id="cell-')
+    assert 'class="highlight-ipynb hl-python' in html
+    assert "clipboard-copy-txt" not in html
@@ -0,0 +1,51 @@
+from jupyter_client.blocking import BlockingKernelClient
+
+from mkdocs_jupyter.kernels import KernelPool
+
+
+def run_code(km, code, expression=None):
+    kc = BlockingKernelClient(connection_file=km.connection_file)
+    kc.load_connection_file()
+    kc.start_channels()
+    try:
+        kc.wait_for_ready(timeout=60)
+        expressions = {"value": expression} if expression else {}
+        reply = kc.execute_interactive(
+            code, user_expressions=expressions, output_hook=lambda msg: None
+        )
+        if expression:
+            value = reply["content"]["user_expressions"]["value"]
+            return value["data"]["text/plain"]
+    finally:
+        kc.stop_channels()
+
+
+def test_kernel_reused_and_reset(tmp_path):
+    pool = KernelPool()
+    try:
+        km = pool.acquire("python3", cwd=str(tmp_path), warmup="warm = 1")
+        run_code(km, "leak = 1")
+        pool.release("python3", km, warmup="warm = 1")
+
+        km2 = pool.acquire("python3", cwd=str(tmp_path), warmup="warm = 1")
+        assert km2 is km
+        # The namespace is cleared between notebooks but warmed up again
+        assert run_code(km2, "", "'leak' in dir()") == "False"
+        assert run_code(km2, "", "'warm' in dir()") == "True"
+        pool.release("python3", km2, warmup="warm = 1")
+    finally:
+        pool.shutdown()
+
+
+def test_discarded_kernel_not_reused(tmp_path):
+    pool = KernelPool()
+    try:
+        km = pool.acquire("python3", cwd=str(tmp_path))
+        pool.release("python3", km, discard=True)
+        assert not km.is_alive()
+
+        km2 = pool.acquire("python3", cwd=str(tmp_path))
+        assert km2 is not km
+        pool.release("python3", km2)
+    finally:
+        pool.shutdown()
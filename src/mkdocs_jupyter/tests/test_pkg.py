@@ -24,6 +24,7 @@ def test_assets_included():
 
     html_assets = os.path.join(mkdocs_html, "assets")
     assert os.path.exists(os.path.join(html_assets, "clipboard.umd.js"))
+    assert os.path.exists(os.path.join(html_assets, "clipboard-notice.js"))
     assert os.path.exists(os.path.join(html_assets, "index.css"))
     assert os.path.exists(os.path.join(html_assets, "theme-dark.css"))
     assert os.path.exists(os.path.join(html_assets, "theme-light.css"))
@@ -40,6 +41,29 @@ def test_markdown_ignored_without_parsing() -> None:
     plug = plugin.Plugin()
     plug.config["ignore"] = ["**/*.md"]
     dummy_md_file = File("file.md", "docs", "site", False)
-    with patch.object(plugin.jupytext, "read") as mock_read:
+    with patch.object(plugin, "_read_front_matter") as mock_read:
         assert plug.should_include(dummy_md_file) is False
         assert mock_read.call_count == 0
+
+
+def test_markdown_classified_once_per_build() -> None:
+    """
+    Test that Markdown files are classified from the front matter only once.
+    """
+    this_dir = os.path.dirname(os.path.realpath(__file__))
+    docs_dir = os.path.join(this_dir, "mkdocs", "docs")
+    plug = plugin.Plugin()
+    plug.load_config({})
+    jupytext_md_file = File("demo-jupytext.md", docs_dir, "site", False)
+    regular_md_file = File("index.md", docs_dir, "site", False)
+    with patch.object(
+        plugin, "_read_front_matter", wraps=plugin._read_front_matter
+    ) as mock_read:
+        for _ in range(3):
+            assert plug.should_include(jupytext_md_file) is True
+            assert plug.should_include(regular_md_file) is False
+        assert mock_read.call_count == 2
+
+        plug.on_pre_build(config={})
+        assert plug.should_include(jupytext_md_file) is True
+        assert mock_read.call_count == 3
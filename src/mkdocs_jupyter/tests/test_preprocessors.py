@@ -0,0 +1,382 @@
+import base64
+import io
+import json
+import time
+from unittest.mock import patch
+
+import nbformat
+import pytest
+from nbclient.exceptions import CellTimeoutError
+from nbformat.v4 import (
+    new_code_cell,
+    new_markdown_cell,
+    new_notebook,
+    new_output,
+)
+
+from mkdocs_jupyter.images import minify_svg
+from mkdocs_jupyter.preprocessors import (
+    CellCache,
+    Execute,
+    ExtractOutputs,
+    TruncateOutputs,
+    WidgetState,
+)
+
+
+@pytest.fixture
+def make_nb(tmp_path):
+    log = tmp_path / "log.txt"
+    log.write_text("")
+
+    def make_nb(last_source="print(x)", independent_source="print('independent')"):
+        return new_notebook(
+            cells=[
+                new_markdown_cell("# Title"),
+                new_code_cell(f"open({str(log)!r}, 'a').write('a')"),
+                new_code_cell("x = 1"),
+                new_code_cell(
+                    independent_source, metadata={"tags": ["cache-independent"]}
+                ),
+                new_code_cell(f"open({str(log)!r}, 'a').write('b')\n{last_source}"),
+            ],
+            metadata={
+                "kernelspec": {
+                    "name": "python3",
+                    "language": "python",
+                    "display_name": "Python 3",
+                }
+            },
+        )
+
+    return make_nb, log
+
+
+def execute(nb, cache_dir):
+    ep = Execute(cell_cache_dir=str(cache_dir), kernel_name="python3")
+    nb, _ = ep.preprocess(nb, {"metadata": {"path": str(cache_dir.parent)}})
+    return nb
+
+
+def test_cell_cache_keys_rolling(make_nb):
+    make, _ = make_nb
+    keys1 = CellCache("unused").keys(make(), "python3", "cache-independent")
+    keys2 = CellCache("unused").keys(
+        make(last_source="print(x + 1)", independent_source="print(2)"),
+        "python3",
+        "cache-independent",
+    )
+    assert sorted(keys1) == [1, 2, 3, 4]
+    assert keys1[1] == keys2[1]
+    assert keys1[2] == keys2[2]
+    assert keys1[3] != keys2[3]
+    assert keys1[4] != keys2[4]
+
+
+def test_unchanged_notebook_not_executed(make_nb, tmp_path):
+    make, log = make_nb
+    nb = execute(make(), tmp_path / "cells")
+    assert log.read_text() == "ab"
+    assert nb.cells[4].outputs[0]["text"] == "1\n"
+
+    nb = execute(make(), tmp_path / "cells")
+    assert log.read_text() == "ab"
+    assert nb.cells[4].outputs[0]["text"] == "1\n"
+    nbformat.validate(nb)
+
+
+def test_changed_cell_replays_prefix(make_nb, tmp_path):
+    make, log = make_nb
+    execute(make(), tmp_path / "cells")
+
+    nb = execute(make(last_source="print(x + 1)"), tmp_path / "cells")
+    assert log.read_text() == "abab"
+    assert nb.cells[4].outputs[0]["text"] == "2\n"
+
+
+def test_changed_independent_cell_runs_alone(make_nb, tmp_path):
+    make, log = make_nb
+    execute(make(), tmp_path / "cells")
+
+    nb = execute(make(independent_source="print('changed')"), tmp_path / "cells")
+    assert log.read_text() == "ab"
+    assert nb.cells[3].outputs[0]["text"] == "changed\n"
+    assert nb.cells[4].outputs[0]["text"] == "1\n"
+
+
+def test_cell_cache_shared_dirs(tmp_path):
+    cell = new_code_cell("x = 1", execution_count=1)
+    CellCache(tmp_path / "shared").save("a" * 64, cell)
+
+    cache = CellCache(tmp_path / "local", [tmp_path / "shared"])
+    assert cache.load("a" * 64)["execution_count"] == 1
+    # Copied to the local cache
+    assert (tmp_path / "local" / f"{'a' * 64}.json").exists()
+    assert CellCache(tmp_path / "local").load("b" * 64) is None
+
+
+@pytest.mark.parametrize("timeout", [3, "3s"])
+def test_execute_timeout(make_nb, tmp_path, timeout):
+    make, log = make_nb
+    nb = make(last_source="import time; time.sleep(60)")
+    ep = Execute(kernel_name="python3", notebook_timeout=60)
+    nb.metadata["mkdocs_jupyter"] = {"execute_timeout": timeout}
+    with pytest.raises(CellTimeoutError):
+        ep.preprocess(nb, {"metadata": {"path": str(tmp_path)}})
+    assert log.read_text() == "ab"
+
+
+def test_execute_build_budget_exhausted(make_nb, tmp_path):
+    make, log = make_nb
+    resources = {"metadata": {"path": str(tmp_path)}, "mkdocs": {}}
+    resources["mkdocs"]["execute_deadline"] = time.time() - 1
+    with pytest.raises(CellTimeoutError):
+        Execute(kernel_name="python3").preprocess(make(), resources)
+    # The kernel was not started
+    assert log.read_text() == ""
+
+
+def test_extract_outputs_dedupes_images(tmp_path):
+    png = base64.b64encode(b"\x89PNG fake image").decode()
+    svg = "<svg></svg>"
+
+    def image_cell():
+        return new_code_cell(
+            "plot()",
+            outputs=[
+                new_output("display_data", data={"image/png": png}),
+                new_output("execute_result", data={"image/svg+xml": svg}),
+            ],
+        )
+
+    nb = new_notebook(cells=[image_cell(), image_cell()])
+    resources = {"mkdocs": {"outputs": {"dir": str(tmp_path), "url": "../out"}}}
+    nb, _ = ExtractOutputs().preprocess(nb, resources)
+
+    files = sorted(
+        (path.name for path in tmp_path.iterdir()), key=lambda name: name[-3:]
+    )
+    assert [name.rsplit(".", 1)[1] for name in files] == ["png", "svg"]
+    filenames = nb.cells[1].outputs[0].metadata.filenames
+    assert filenames["image/png"] in [f"../out/{name}" for name in files]
+    assert (tmp_path / files[1]).read_text() == svg
+
+
+def test_extract_outputs_optimizes_images(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    out = io.BytesIO()
+    Image.new("RGB", (400, 200), "red").save(out, format="PNG")
+    png = base64.b64encode(out.getvalue()).decode()
+    svg = "<svg>\n  <!-- comment -->\n  <g></g>\n</svg>\n"
+    nb = new_notebook(
+        cells=[
+            new_code_cell(
+                "plot()",
+                outputs=[
+                    new_output("display_data", data={"image/png": png}),
+                    new_output("display_data", data={"image/svg+xml": svg}),
+                ],
+            )
+        ]
+    )
+    optimize = {"max_width": 100, "webp": True}
+    resources = {
+        "mkdocs": {
+            "outputs": {"dir": str(tmp_path), "url": "out", "optimize": optimize}
+        }
+    }
+    nb, _ = ExtractOutputs().preprocess(nb, resources)
+
+    outputs = nb.cells[0].outputs
+    webp = outputs[0].metadata.filenames["image/png"]
+    assert webp.endswith(".webp")
+    with Image.open(tmp_path / webp.split("/")[1]) as image:
+        assert image.format == "WEBP"
+        assert image.size == (100, 50)
+    minified = outputs[1].metadata.filenames["image/svg+xml"].split("/")[1]
+    assert (tmp_path / minified).read_text() == "<svg><g></g></svg>"
+
+
+def test_minify_svg_keeps_text_whitespace():
+    svg = (
+        "<svg>\n  <g>\n    <text>\n      <tspan>a</tspan>\n"
+        "      <tspan>b</tspan>\n    </text>\n  </g>\n</svg>\n"
+    )
+    assert minify_svg(svg.encode()).decode() == (
+        "<svg><g><text>\n      <tspan>a</tspan>\n"
+        "      <tspan>b</tspan>\n    </text></g></svg>"
+    )
+
+
+def test_extract_outputs_optimize_fallback(tmp_path):
+    pytest.importorskip("PIL.Image")
+    png = base64.b64encode(b"not a png").decode()
+    nb = new_notebook(
+        cells=[
+            new_code_cell(
+                "plot()",
+                outputs=[new_output("display_data", data={"image/png": png})],
+            )
+        ]
+    )
+    optimize = {"max_width": 100, "webp": True}
+    resources = {
+        "mkdocs": {
+            "outputs": {"dir": str(tmp_path), "url": "out", "optimize": optimize}
+        }
+    }
+    nb, _ = ExtractOutputs().preprocess(nb, resources)
+
+    # The original image is written with its own extension
+    filename = nb.cells[0].outputs[0].metadata.filenames["image/png"]
+    assert filename.endswith(".png")
+    assert (tmp_path / filename.split("/")[1]).read_bytes() == b"not a png"
+
+    # and reused by the next builds
+    del nb.cells[0].outputs[0].metadata["filenames"]
+    with patch("mkdocs_jupyter.images.optimize_image") as mock_optimize:
+        nb, _ = ExtractOutputs().preprocess(nb, resources)
+        mock_optimize.assert_not_called()
+    assert nb.cells[0].outputs[0].metadata.filenames["image/png"] == filename
+
+
+def test_extract_outputs_lazy(tmp_path):
+    small = "<b>small</b>"
+    large = "<div>" + "x" * 100 + "</div>"
+    nb = new_notebook(
+        cells=[
+            new_code_cell(
+                "show()",
+                outputs=[
+                    new_output("display_data", data={"text/html": small}),
+                    new_output("execute_result", data={"text/html": large}),
+                ],
+            )
+        ]
+    )
+    outputs = {"dir": str(tmp_path), "url": "out", "images": False, "lazy_size": 50}
+    nb, _ = ExtractOutputs().preprocess(nb, {"mkdocs": {"outputs": outputs}})
+
+    small_output, large_output = nb.cells[0].outputs
+    assert "filenames" not in small_output.metadata
+    name = large_output.metadata.filenames["text/html"].split("/")[1]
+    assert name.endswith(".html")
+    assert (tmp_path / name).read_text() == large
+
+
+def test_truncate_outputs(tmp_path):
+    text = "".join(f"\x1b[32mline {i}\x1b[0m\n" for i in range(100))
+    nb = new_notebook(
+        cells=[
+            new_code_cell(
+                "train()",
+                outputs=[
+                    new_output("stream", name="stdout", text=text),
+                    new_output("stream", name="stderr", text="short\n"),
+                ],
+            )
+        ]
+    )
+    outputs = {"dir": str(tmp_path), "url": "out", "max_lines": 4}
+    nb, _ = TruncateOutputs().preprocess(nb, {"mkdocs": {"outputs": outputs}})
+
+    long_output, short_output = nb.cells[0].outputs
+    lines = long_output.text.splitlines()
+    assert lines[2] == "[... 96 lines truncated ...]"
+    assert [lines[0], lines[-1]] == [text.split("\n")[0], text.split("\n")[99]]
+    assert short_output.text == "short\n"
+    name = long_output["metadata"]["filenames"]["text/plain"].split("/")[1]
+    full = (tmp_path / name).read_text()
+    assert full.splitlines()[50] == "line 50"
+
+
+def test_truncate_outputs_bytes(tmp_path):
+    traceback = ["Traceback", "x" * 1000, "ValueError: bad"]
+    nb = new_notebook(
+        cells=[
+            new_code_cell(
+                "fail()",
+                outputs=[new_output("error", traceback=traceback)],
+            )
+        ]
+    )
+    outputs = {"dir": str(tmp_path), "url": "out", "max_bytes": 40}
+    nb, _ = TruncateOutputs().preprocess(nb, {"mkdocs": {"outputs": outputs}})
+
+    truncated = nb.cells[0].outputs[0].traceback
+    assert truncated[0] == "Traceback"
+    assert truncated[-1] == "ValueError: bad"
+    assert "[... 986 bytes truncated ...]" in truncated
+    assert len("\n".join(truncated)) < 100
+
+
+def make_widgets_nb():
+    def model(children=()):
+        return {
+            "model_name": "BoxModel",
+            "state": {"children": [f"IPY_MODEL_{child}" for child in children]},
+        }
+
+    state = {
+        "version_major": 2,
+        "version_minor": 0,
+        "state": {"box": model(["child"]), "child": model(), "hidden": model()},
+    }
+    view = {"version_major": 2, "version_minor": 0, "model_id": "box"}
+    nb = new_notebook(
+        cells=[
+            new_code_cell(
+                "box",
+                outputs=[
+                    new_output(
+                        "display_data",
+                        data={"application/vnd.jupyter.widget-view+json": view},
+                    )
+                ],
+            )
+        ]
+    )
+    nb.metadata["widgets"] = {"application/vnd.jupyter.widget-state+json": state}
+    return nb
+
+
+def test_widget_state_prune(tmp_path):
+    outputs = {"dir": str(tmp_path), "url": "out", "prune_widgets": True}
+    resources = {"mkdocs": {"outputs": outputs}}
+    nb, resources = WidgetState().preprocess(make_widgets_nb(), resources)
+
+    state = nb.metadata.widgets["application/vnd.jupyter.widget-state+json"]
+    assert sorted(state["state"]) == ["box", "child"]
+    assert "widget_state_url" not in resources["mkdocs"]
+
+
+def test_widget_state_prune_links(tmp_path):
+    nb = make_widgets_nb()
+    state = nb.metadata.widgets["application/vnd.jupyter.widget-state+json"]
+    # jslink((child, "value"), (slider, "value")), the link is not displayed
+    state["state"]["link"] = {
+        "model_name": "LinkModel",
+        "state": {
+            "source": ["IPY_MODEL_child", "value"],
+            "target": ["IPY_MODEL_slider", "value"],
+        },
+    }
+    state["state"]["slider"] = {"model_name": "IntSliderModel", "state": {}}
+    outputs = {"dir": str(tmp_path), "url": "out", "prune_widgets": True}
+    resources = {"mkdocs": {"outputs": outputs}}
+    nb, resources = WidgetState().preprocess(nb, resources)
+
+    state = nb.metadata.widgets["application/vnd.jupyter.widget-state+json"]
+    assert sorted(state["state"]) == ["box", "child", "link", "slider"]
+
+
+def test_widget_state_external(tmp_path):
+    outputs = {"dir": str(tmp_path), "url": "out", "widget_state": "external"}
+    resources = {"mkdocs": {"outputs": outputs}}
+    nb, resources = WidgetState().preprocess(make_widgets_nb(), resources)
+
+    assert "widgets" not in nb.metadata
+    (path,) = tmp_path.iterdir()
+    assert resources["mkdocs"]["widget_state_url"] == f"out/{path.name}"
+    state = json.loads(path.read_text())
+    assert sorted(state["state"]) == ["box", "child", "hidden"]
@@ -0,0 +1,41 @@
+import time
+
+from mkdocs_jupyter import timing
+
+
+def test_nested_stages_are_exclusive():
+    timings = timing.new_timings("nb.ipynb")
+    with timing.measure(timings, memory=True):
+        with timing.stage("export"):
+            time.sleep(0.02)
+            with timing.stage("execute"):
+                time.sleep(0.05)
+        data = [0] * 100_000
+
+    stages = timings["stages"]
+    assert 0.05 <= stages["execute"] < stages["execute"] + stages["export"]
+    assert 0.02 <= stages["export"] < 0.05
+    assert timings["total"] >= stages["execute"] + stages["export"]
+    assert timings["peak_memory"] >= len(data) * 8
+
+
+def test_stage_outside_measure_is_ignored():
+    @timing.timed("hash")
+    def compute():
+        return 1
+
+    assert compute() == 1
+    timings = timing.new_timings("nb.ipynb")
+    with timing.measure(timings):
+        compute()
+        compute()
+    assert list(timings["stages"]) == ["hash"]
+
+
+def test_merge():
+    timings = {"path": "a", "total": 1.0, "stages": {"wait": 1.0}, "peak_memory": 5}
+    other = {"path": "a", "total": 1.0, "stages": {"export": 0.5}, "peak_memory": 9}
+    timing.merge(timings, other)
+    assert timings["stages"] == {"wait": 1.0, "export": 0.5}
+    assert timings["peak_memory"] == 9
+    assert timings["total"] == 1.0
@@ -4,7 +4,7 @@ import pytest
 from mkdocs.config import load_config
 from mkdocs.structure.toc import AnchorLink, TableOfContents
 
-from mkdocs_jupyter import plugin
+from mkdocs_jupyter import convert, plugin
 
 
 @pytest.mark.parametrize(
@@ -39,3 +39,22 @@ def test_anchors_count(test_file_path, expected_anchor_count) -> None:
         traverse_stack = anchor.children + traverse_stack
 
     assert anchor_count == expected_anchor_count
+
+
+@pytest.mark.parametrize(
+    "test_file_path",
+    [
+        "./mkdocs/docs/backquote_toc_test.ipynb",
+        "./mkdocs/docs/demo.ipynb",
+        "./mkdocs/docs/demo-script.py",
+        "./mkdocs/docs/variational-inference.md",
+    ],
+)
+def test_toc_same_as_nb2md(test_file_path) -> None:
+    """The TOC from the markdown cells matches the one from a full nb2md export"""
+    this_dir = os.path.dirname(os.path.realpath(__file__))
+    test_file_dir = os.path.join(this_dir, test_file_path)
+
+    expected = plugin._get_markdown_toc(convert.nb2md(test_file_dir), 6)
+    toc_tokens, _ = plugin._get_nb_toc_tokens(test_file_dir, 6)
+    assert toc_tokens == expected
@@ -0,0 +1,114 @@
+"""
+Timing of the stages of the notebook conversion
+
+`measure` collects the time spent in every `stage` (reading, executing,
+exporting, hashing...) of a notebook in a dict. The current notebook is kept
+in a context variable so the stages can be measured anywhere in the call
+stack, including the worker processes, and stages outside `measure` cost
+almost nothing. The time of a stage excludes the stages nested in it.
+"""
+
+import contextlib
+import contextvars
+import functools
+import logging
+import time
+import tracemalloc
+
+logger = logging.getLogger("mkdocs.mkdocs-jupyter")
+
+# (timings, stack of the time spent in the nested stages) of the notebook
+_current = contextvars.ContextVar("mkdocs_jupyter_timing", default=None)
+
+
+def new_timings(path):
+    """Return the empty timings of a notebook"""
+    return {"path": path, "total": 0.0, "stages": {}, "peak_memory": None}
+
+
+@contextlib.contextmanager
+def measure(timings, memory=False):
+    """Add the time spent in the stages of the block to timings
+
+    With memory the peak memory allocated by Python during the block is
+    recorded too (using tracemalloc, which slows down the build).
+    Does nothing if timings is None.
+    """
+    if timings is None:
+        yield timings
+        return
+    if memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    token = _current.set((timings, []))
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings["total"] += time.perf_counter() - start
+        _current.reset(token)
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            timings["peak_memory"] = max(timings["peak_memory"] or 0, peak)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Measure a stage of the notebook being measured"""
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    timings, stack = current
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = stack.pop()
+        stages = timings["stages"]
+        stages[name] = stages.get(name, 0.0) + elapsed - nested
+        if stack:
+            stack[-1] += elapsed
+
+
+def timed(name):
+    """Decorator to measure every call of a function as a stage"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def merge(timings, other):
+    """Add the stages and peak memory of other (e.g. from a worker) to timings"""
+    for name, elapsed in other["stages"].items():
+        timings["stages"][name] = timings["stages"].get(name, 0.0) + elapsed
+    if other["peak_memory"] is not None:
+        timings["peak_memory"] = max(timings["peak_memory"] or 0, other["peak_memory"])
+
+
+def log_slowest(notebooks, top=10):
+    """Log the slowest notebooks with their slowest stages"""
+    notebooks = sorted(notebooks, key=lambda timings: -timings["total"])[:top]
+    if not notebooks:
+        return
+    logger.info("Slowest notebooks:")
+    for timings in notebooks:
+        stages = sorted(timings["stages"].items(), key=lambda item: -item[1])
+        breakdown = ", ".join(f"{name} {elapsed:.2f}s" for name, elapsed in stages[:3])
+        logger.info(
+            "  %.2fs %s (%s, %s)",
+            timings["total"],
+            timings["path"],
+            timings.get("cache") or "no cache",
+            breakdown,
+        )